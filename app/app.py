@@ -1,15 +1,29 @@
-from flask import Flask, jsonify, render_template, url_for, redirect, request, session, flash
+from flask import Flask, jsonify, render_template, url_for, redirect, request, session, flash, stream_with_context, g
+from flask.json import dumps as json_dumps
 from pymongo import MongoClient
-from weather_service import WeatherService
+from weather_service import WeatherService, HISTORICAL_PAGE_LIMIT, historical_window_start
+from warning_stats import STATS_GROUP_FIELDS, STATS_MAX_DAYS, parse_day
 from auth_config import *
-from token_manager import TokenManager
+from token_manager import TokenManager, MAX_REFRESH_SLEEP
+from google_client import GoogleClient
+from session_cache import SessionCache
+from change_feed import ChangeFeed
+from job_lease import JobLease
+from ingest import IngestWorker, add_ingest_jobs
+from scheduler import Scheduler
+from version_watcher import VersionWatcher
+from geometry_simplify import GEOMETRY_CHOICES, GEOMETRY_FULL
+from http_cache import choose_encoding, compress, etag_matches, json_response, not_modified, MIN_COMPRESS_SIZE, ENCODING_IDENTITY
 import os
 from datetime import datetime, timedelta
+import atexit
+import signal
 import threading
 import time
-from logging_config import setup_logger, log_to_file
+from logging_config import setup_logger, SAMPLED
+from metrics import (MongoCommandMetrics, HTTP_REQUEST_DURATION, HTTP_REQUEST_MONGO_COMMANDS, CONTENT_TYPE,
+                     render_metrics, request_mongo_commands, reset_request_mongo_commands)
 from oauthlib.oauth2 import WebApplicationClient
-import requests
 from functools import wraps
 import json
 import secrets
@@ -17,6 +31,32 @@ import secrets
 # Initialize logging
 logger = setup_logger('app', 'app.log')
 
+# 'embedded' runs warning ingest in a web process thread, 'external' leaves it to ingest.py
+INGEST_MODE = os.environ.get('INGEST_MODE', 'embedded')
+
+# Seconds between version checks when Mongo change streams are unavailable
+VERSION_POLL_INTERVAL = float(os.environ.get('VERSION_POLL_INTERVAL', 5))
+
+# Longest wait between checks for warnings starting or ending between ingests
+TRANSITION_CHECK_INTERVAL = 300
+
+def install_shutdown_handler(shutdown):
+    """Run shutdown on SIGTERM and at exit, chaining to any handler already installed (e.g. gunicorn's)"""
+    atexit.register(shutdown)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        logger.info("Received SIGTERM, stopping background jobs")
+        shutdown()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
 def create_app():
     app = Flask(__name__)
     app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
@@ -50,7 +90,7 @@ def create_app():
             logger.critical("MongoDB URI not provided in environment variables")
             raise ValueError("MongoDB URI is required")
             
-        db_client = MongoClient(mongodb_uri)
+        db_client = MongoClient(mongodb_uri, event_listeners=[MongoCommandMetrics()])
         db = db_client.myapp
         # Test connection
         db_client.admin.command('ping')
@@ -60,64 +100,119 @@ def create_app():
         raise
 
     # Initialize token manager
+    # One pooled client with timeouts and retries for all Google traffic
+    google = GoogleClient(logger)
+
     token_manager = TokenManager(
         logger=logger,
-        secret_key=os.environ.get('ENCRYPTION_KEY')
+        secret_key=os.environ.get('ENCRYPTION_KEY'),
+        http_session=google.session
     )
 
-    # Start token refresh thread
     google_config = {
         'client_id': GOOGLE_CLIENT_ID,
         'client_secret': GOOGLE_CLIENT_SECRET
     }
-    token_manager.start_token_refresh_thread(db, google_config)
+    token_manager.setup_indexes(db)
+
+    # Owns every background job; jobs with a lease only run in the process holding it
+    scheduler = Scheduler(logger)
+    token_lease = JobLease(db, logger, 'token_refresh')
+    token_lease.start()
+
+    def refresh_tokens():
+        """Refresh expiring tokens under the fencing token held when the job starts"""
+        # Read once up front: a lease lost mid-run leaves this token stale, and its writes fenced off
+        fencing_token = token_lease.fencing_token
+        token_manager.refresh_expiring_tokens(db, google_config, fencing_token)
+
+    scheduler.add_job(
+        'token_refresh',
+        refresh_tokens,
+        MAX_REFRESH_SLEEP,
+        lease=token_lease,
+        next_interval=lambda: token_manager.seconds_until_next_refresh(db)
+    )
 
     # Initialize weather service
     weather_service = WeatherService(db)
 
-    def update_warnings_periodically():
-        """Background task to update warnings"""
-        logger.info("Starting periodic warning updates thread")
-        while True:
-            try:
-                start_time = datetime.utcnow()
-                logger.info(f"Running periodic warning update at {start_time}")
-                
-                warnings = weather_service.fetch_warnings()
-                logger.info(f"Fetch result: {'Successful' if warnings else 'No warnings received'}")
-                
-                if warnings:
-                    save_result = weather_service.save_warnings(warnings)
-                    if save_result:
-                        logger.info(f"Successfully updated warnings at {datetime.utcnow()}")
-                    else:
-                        logger.error("Failed to save warnings to database")
-                else:
-                    logger.warning("No warnings received from ZAMG API")
-                
-                # Calculate processing time and adjust sleep accordingly
-                processing_time = (datetime.utcnow() - start_time).total_seconds()
-                sleep_time = max(0, 300 - processing_time)  # Ensure 5-minute intervals
-                logger.info(f"Sleeping for {sleep_time} seconds until next update")
-                time.sleep(sleep_time)
-                
-            except Exception as e:
-                logger.error(f"Error in periodic update: {str(e)}", exc_info=True)
-                time.sleep(60)  # Wait a minute before retrying if there's an error
+    # Cache of validated sessions so protected requests skip the users lookup
+    session_cache = SessionCache(db, logger)
+
+    # Push channel for dashboards, notified when an ingest changes the warnings
+    change_feed = ChangeFeed(
+        logger,
+        max_connections=int(os.environ.get('SSE_MAX_CONNECTIONS', 500)),
+        heartbeat_interval=float(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))
+    )
+
+    # Warnings also start and end between ingests, which changes the active set without a commit
+    published_validator = {'value': weather_service.snapshot.current_validator()}
+
+    def publish_active_transitions():
+        """Notify clients when the active set rolled past a start or end time since the last check"""
+        ingest_version, last_transition = weather_service.snapshot.current_validator()
+        previous_version, previous_transition = published_validator['value']
+        published_validator['value'] = (ingest_version, last_transition)
+        # Commits publish their own event
+        if ingest_version == previous_version and last_transition != previous_transition:
+            change_feed.publish(ingest_version)
+
+    def seconds_until_transition():
+        seconds = weather_service.snapshot.seconds_until_transition()
+        if seconds is None:
+            return TRANSITION_CHECK_INTERVAL
+        # The snapshot rolls forward once the transition time has passed
+        return min(max(seconds + 1, 1), TRANSITION_CHECK_INTERVAL)
+
+    scheduler.add_job('active_transitions', publish_active_transitions, TRANSITION_CHECK_INTERVAL,
+                      jitter=0, next_interval=seconds_until_transition)
+
+    def publish_commit(version):
+        change_feed.publish(version)
+        # The commit may bring an earlier transition than the one being waited for
+        scheduler.run_now('active_transitions')
+
+    # Only the process holding the lease fetches and saves warnings. With
+    # INGEST_MODE=external a separate `python ingest.py` worker does it instead.
+    ingest_lease = None
+    if INGEST_MODE == 'embedded':
+        ingest_lease = JobLease(db, logger, 'warning_ingest')
+        ingest_lease.start()
+        add_ingest_jobs(scheduler, IngestWorker(weather_service, ingest_lease, logger, on_commit=publish_commit))
+    else:
+        logger.info("Warning ingest runs in an external worker")
+
+    def sync_committed_version():
+        """Pick up versions committed by whichever process holds the ingest lease"""
+        if ingest_lease is not None and ingest_lease.is_leader:
+            return
+        if weather_service.sync_snapshot():
+            publish_commit(weather_service.snapshot.ingest_version)
+
+    version_watcher = VersionWatcher(db, logger, sync_committed_version, poll_interval=VERSION_POLL_INTERVAL)
+    version_watcher.start()
+
+    scheduler.start()
 
-    # Start the background task
-    logger.info("Initializing background update task...")
-    update_thread = threading.Thread(target=update_warnings_periodically, daemon=True)
-    update_thread.start()
-    logger.info("Background warning update thread started successfully")
+    def shutdown():
+        """Stop background jobs and hand leases over before the process exits"""
+        scheduler.stop()
+        version_watcher.stop()
+        for lease in (token_lease, ingest_lease):
+            if lease is not None:
+                lease.stop()
+
+    install_shutdown_handler(shutdown)
 
     def login_required(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             auth_result = is_authenticated()
-            logger.info(f"Auth check for {request.path}: {auth_result}")
+            logger.debug("Auth check for %s: %s", request.path, auth_result)
             if not auth_result:
-                logger.info(f"User not authenticated, redirecting to login. Session data: {session.get('user')}")
+                logger.info("User not authenticated, redirecting to login from %s", request.path, extra=SAMPLED)
                 return redirect(url_for('login'))
             return f(*args, **kwargs)
         return decorated_function
@@ -125,42 +220,42 @@ def create_app():
     def is_authenticated():
         """Check if user is authenticated"""
         if 'user' not in session:
-            logger.info("No user in session")
+            logger.debug("No user in session")
             return False
         
-        user = db.users.find_one({
-            'google_id': session['user']['id'],
-            'session_token': session['user'].get('session_token')
-        })
-        
-        logger.info(f"Authentication check result: {user is not None}")
-        return user is not None
+        return session_cache.is_valid(
+            session['user']['id'],
+            session['user'].get('session_token')
+        )
 
-    def get_google_provider_cfg():
-        try:
-            return requests.get(GOOGLE_DISCOVERY_URL).json()
-        except Exception as e:
-            logger.error(f"Error fetching Google provider config: {str(e)}")
-            return None
+    def invalid_geometry_level():
+        return jsonify({'error': f"geometry must be one of: {', '.join(GEOMETRY_CHOICES)}"}), 400
 
-    @app.teardown_appcontext
-    def cleanup(error):
-        """Cleanup resources"""
-        token_manager.stop_token_refresh_thread()
+    def get_google_provider_cfg():
+        return google.provider_config()
 
     @app.before_request
     def before_request():
-        """Log request info and check session"""
+        """Record request start and keep the session alive"""
         if request.path.startswith('/static/'):
             return
-        log_to_file(logger, f"Request: {request.method} {request.url}")
+        g.request_started = time.perf_counter()
+        reset_request_mongo_commands()
         session.permanent = True
 
     @app.after_request
     def after_request(response):
-        """Log response info"""
-        if not request.path.startswith('/static/'):
-            log_to_file(logger, f"Response: {response.status}")
+        """Record request metrics and log a sample of requests with their status and duration"""
+        if not request.path.startswith('/static/') and 'request_started' in g:
+            duration = time.perf_counter() - g.request_started
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUEST_DURATION.observe(request.method, route, response.status_code, value=duration)
+            HTTP_REQUEST_MONGO_COMMANDS.observe(route, value=request_mongo_commands())
+            logger.info(
+                "%s %s -> %s in %.1fms",
+                request.method, request.path, response.status_code, duration * 1000,
+                extra=SAMPLED
+            )
         return response
 
     # OAuth 2 client setup
@@ -202,11 +297,11 @@ def create_app():
                 code=code
             )
             
-            token_response = requests.post(
+            token_response = google.post(
                 token_url,
                 headers=headers,
                 data=body,
-                auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET),
+                auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET)
             )
 
             if token_response.status_code != 200:
@@ -218,7 +313,7 @@ def create_app():
             
             userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
             uri, headers, body = client.add_token(userinfo_endpoint)
-            userinfo_response = requests.get(uri, headers=headers)
+            userinfo_response = google.get(uri, headers=headers)
             
             if userinfo_response.status_code != 200:
                 logger.error(f"Userinfo request failed: {userinfo_response.text}")
@@ -241,6 +336,7 @@ def create_app():
                 if refresh_token:
                     encrypted_refresh_token = token_manager.encrypt_token(refresh_token)
                     user_data['refresh_token'] = encrypted_refresh_token
+                    user_data['token_expires_at'] = token_manager.token_expiry(tokens)
                 
                 result = db.users.update_one(
                     {'google_id': user_data['google_id']},
@@ -250,6 +346,11 @@ def create_app():
                     },
                     upsert=True
                 )
+                # The new session token replaces any session on other devices
+                session_cache.revoke(user_data['google_id'])
+                if refresh_token:
+                    # Let the refresh schedule account for the new token's expiry
+                    scheduler.run_now('token_refresh')
                 
                 session['user'] = {
                     'id': userinfo["sub"],
@@ -275,6 +376,7 @@ def create_app():
                     {'google_id': session['user']['id']},
                     {'$unset': {'session_token': ""}}
                 )
+                session_cache.revoke(session['user']['id'])
             session.clear()
             return redirect(url_for('login'))
         except Exception as e:
@@ -291,26 +393,208 @@ def create_app():
     @app.route('/api/warnings')
     @login_required
     def get_warnings():
-        """Get active warnings"""
+        """Get active warnings, or only the changes since an ingest version with ?since="""
         try:
-            warnings = weather_service.get_active_warnings(session['user']['id'])
-            return jsonify(warnings)
+            geometry_level = request.args.get('geometry', GEOMETRY_FULL)
+            if geometry_level not in GEOMETRY_CHOICES:
+                return invalid_geometry_level()
+            user_id = session['user']['id']
+            since = request.args.get('since', type=int)
+            
+            # Answer revalidations from the snapshot version alone
+            etag = weather_service.get_warnings_etag(user_id, 'active', geometry_level, since)
+            if etag_matches(request, etag):
+                return not_modified(app.response_class, etag)
+            
+            if since is not None:
+                delta = weather_service.get_warnings_delta(since, user_id, geometry_level)
+                body = json_dumps(delta).encode('utf-8')
+                encoding = choose_encoding(request) if len(body) >= MIN_COMPRESS_SIZE else ENCODING_IDENTITY
+                response = json_response(app.response_class, compress(body, encoding), etag, encoding)
+                response.headers['X-Warnings-Version'] = str(delta['version'])
+                return response
+            
+            ingest_version, body, encoding = weather_service.get_active_warnings_json(
+                user_id, json_dumps, geometry_level, choose_encoding(request)
+            )
+            response = json_response(app.response_class, body, etag, encoding)
+            response.headers['X-Warnings-Version'] = str(ingest_version)
+            return response
         except Exception as e:
             logger.error(f"Error getting warnings: {str(e)}")
             return jsonify({'error': 'Internal server error'}), 500
 
+    @app.route('/api/warnings/stream')
+    @login_required
+    def stream_warning_changes():
+        """Push a Server-Sent Event whenever an ingest changes the warnings"""
+        if not change_feed.acquire():
+            return jsonify({'error': 'Too many open streams'}), 503
+        
+        user_id = session['user']['id']
+        session_token = session['user'].get('session_token')
+        events = change_feed.stream(
+            request.headers.get('Last-Event-ID'),
+            still_valid=lambda: session_cache.is_valid(user_id, session_token)
+        )
+        response = app.response_class(events, mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.call_on_close(change_feed.release)
+        return response
+
+    @app.route('/api/warnings/at')
+    @login_required
+    def get_warnings_at_location():
+        """Get active warnings covering a location"""
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        if lat is None or lon is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+            return jsonify({'error': 'Valid lat and lon parameters are required'}), 400
+        geometry_level = request.args.get('geometry', GEOMETRY_FULL)
+        if geometry_level not in GEOMETRY_CHOICES:
+            return invalid_geometry_level()
+        try:
+            warnings = weather_service.get_warnings_at_location(lat, lon, session['user']['id'], geometry_level)
+            return jsonify(warnings)
+        except Exception as e:
+            logger.error(f"Error getting warnings at location: {str(e)}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    @app.route('/api/warnings/bbox')
+    @login_required
+    def get_warnings_in_bbox():
+        """Get active warnings intersecting a bounding box given as min_lon,min_lat,max_lon,max_lat"""
+        try:
+            bbox = tuple(float(value) for value in request.args.get('bbox', '').split(','))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            return jsonify({'error': 'bbox must be min_lon,min_lat,max_lon,max_lat'}), 400
+        geometry_level = request.args.get('geometry', GEOMETRY_FULL)
+        if geometry_level not in GEOMETRY_CHOICES:
+            return invalid_geometry_level()
+        try:
+            warnings = weather_service.get_warnings_in_bbox(bbox, session['user']['id'], geometry_level)
+            return jsonify(warnings)
+        except Exception as e:
+            logger.error(f"Error getting warnings in bbox: {str(e)}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    @app.route('/api/warnings/municipality/<code>')
+    @login_required
+    def get_warnings_for_municipality(code):
+        """Get active warnings for a municipality"""
+        geometry_level = request.args.get('geometry', GEOMETRY_FULL)
+        if geometry_level not in GEOMETRY_CHOICES:
+            return invalid_geometry_level()
+        try:
+            warnings = weather_service.get_warnings_for_municipality(code, session['user']['id'], geometry_level)
+            return jsonify(warnings)
+        except Exception as e:
+            logger.error(f"Error getting warnings for municipality {code}: {str(e)}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    @app.route('/api/warnings/<int:warning_id>/raw')
+    @login_required
+    def get_warning_payload(warning_id):
+        """Get the raw ZAMG feature of a warning"""
+        payload = weather_service.get_warning_payload(warning_id, request.args.get('content_hash'))
+        if payload is None:
+            return jsonify({'error': 'Warning payload not found'}), 404
+        return jsonify(payload)
+
     @app.route('/api/warnings/historical')
     @login_required
     def get_historical_warnings():
-        """Get historical warnings"""
+        """Get historical warnings, one keyset page at a time or streamed as NDJSON"""
         try:
             days = request.args.get('days', default=7, type=int)
-            warnings = weather_service.get_historical_warnings(days, session['user']['id'])
-            return jsonify(warnings)
+            user_id = session['user']['id']
+            
+            if request.args.get('format') == 'ndjson':
+                def generate():
+                    for warning in weather_service.iter_historical_warnings(days, user_id):
+                        yield json_dumps(warning) + '\n'
+                return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+            
+            limit = request.args.get('limit', default=HISTORICAL_PAGE_LIMIT, type=int)
+            cursor = request.args.get('cursor')
+            
+            # History only changes when an ingest commits, which bumps the snapshot version,
+            # or when the window start moves on to the next day
+            window_start = historical_window_start(days).strftime('%Y-%m-%d')
+            etag = weather_service.get_warnings_etag(user_id, 'historical', days, limit, cursor, window_start)
+            if etag_matches(request, etag):
+                return not_modified(app.response_class, etag)
+            
+            try:
+                warnings, next_cursor = weather_service.get_historical_warnings(days, user_id, limit=limit, cursor=cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            
+            body = json_dumps(warnings).encode('utf-8')
+            encoding = choose_encoding(request) if len(body) >= MIN_COMPRESS_SIZE else ENCODING_IDENTITY
+            response = json_response(app.response_class, compress(body, encoding), etag, encoding)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response
         except Exception as e:
             logger.error(f"Error getting historical warnings: {str(e)}")
             return jsonify({'error': 'Internal server error'}), 500
 
+    @app.route('/api/warnings/historical/daily')
+    @login_required
+    def get_daily_warning_summaries():
+        """Get warning counts per day by type and level from the statistics rollups"""
+        days = request.args.get('days', default=90, type=int)
+        if not 1 <= days <= STATS_MAX_DAYS:
+            return jsonify({'error': f"days must be between 1 and {STATS_MAX_DAYS}"}), 400
+        try:
+            return jsonify(weather_service.get_daily_summaries(days))
+        except Exception as e:
+            logger.error(f"Error getting daily warning summaries: {str(e)}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    @app.route('/api/warnings/stats')
+    @login_required
+    def get_warning_stats():
+        """Get warning counts and active time per day, type, level or municipality from the rollups"""
+        try:
+            today = datetime.utcnow().strftime('%Y-%m-%d')
+            end_day = parse_day(request.args.get('to', today))
+            start_day = parse_day(request.args.get('from', (end_day - timedelta(days=29)).strftime('%Y-%m-%d')))
+        except ValueError:
+            return jsonify({'error': 'from and to must be dates in YYYY-MM-DD format'}), 400
+        if start_day > end_day or (end_day - start_day).days >= STATS_MAX_DAYS:
+            return jsonify({'error': f"from must not be after to, and the range at most {STATS_MAX_DAYS} days"}), 400
+        
+        group_by = [field for field in request.args.get('group_by', 'day').split(',') if field]
+        if not group_by or any(field not in STATS_GROUP_FIELDS for field in group_by):
+            return jsonify({'error': f"group_by must be a list of: {', '.join(STATS_GROUP_FIELDS)}"}), 400
+        municipality = request.args.get('municipality')
+        if municipality is not None and not municipality.isalnum():
+            return jsonify({'error': 'Invalid municipality code'}), 400
+        
+        try:
+            # Rollups only change when an ingest commits, which bumps the snapshot version
+            etag = weather_service.get_warnings_etag(None, 'stats', request.query_string.decode('utf-8'), today)
+            if etag_matches(request, etag):
+                return not_modified(app.response_class, etag)
+            
+            stats = weather_service.get_warning_stats(
+                start_day, end_day, list(dict.fromkeys(group_by)),
+                warning_type=request.args.get('warning_type'),
+                warning_level=request.args.get('warning_level'),
+                municipality=municipality
+            )
+            body = json_dumps(stats).encode('utf-8')
+            encoding = choose_encoding(request) if len(body) >= MIN_COMPRESS_SIZE else ENCODING_IDENTITY
+            return json_response(app.response_class, compress(body, encoding), etag, encoding)
+        except Exception as e:
+            logger.error(f"Error getting warning statistics: {str(e)}")
+            return jsonify({'error': 'Internal server error'}), 500
+
     @app.route('/api/preferences', methods=['GET', 'POST'])
     @login_required
     def handle_preferences():
@@ -344,6 +628,26 @@ def create_app():
             return jsonify({'authenticated': False}), 401
         return jsonify({'authenticated': True})
 
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus metrics for this process"""
+        return app.response_class(render_metrics(), content_type=CONTENT_TYPE)
+
+    @app.route('/healthz')
+    def healthz():
+        """Report each background job's last run, duration and lag"""
+        jobs = scheduler.status()
+        # A job running well past its due time is stuck or starved
+        stalled = [name for name, job in jobs.items()
+                   if job['leader'] and job['lag'] > scheduler.jobs[name].interval]
+        return jsonify({
+            'status': 'degraded' if stalled else 'ok',
+            'stalled': stalled,
+            'ingest_mode': INGEST_MODE,
+            'warnings_version': weather_service.snapshot.ingest_version,
+            'jobs': jobs
+        }), 503 if stalled else 200
+
     return app
 
 if __name__ == '__main__':
@@ -4,7 +4,11 @@ from datetime import timedelta
 # OAuth 2.0 credentials
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET')
-GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
+# Overridable so load tests can point the OAuth flow at a local stand-in
+GOOGLE_DISCOVERY_URL = os.environ.get(
+    'GOOGLE_DISCOVERY_URL', "https://accounts.google.com/.well-known/openid-configuration"
+)
+GOOGLE_TOKEN_URL = os.environ.get('GOOGLE_TOKEN_URL', "https://oauth2.googleapis.com/token")
 
 # Flask session configuration
 SESSION_COOKIE_NAME = 'infocal_session'
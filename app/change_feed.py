@@ -0,0 +1,73 @@
+import json
+import secrets
+import threading
+from logging import Logger
+from typing import Callable, Iterator, Optional
+
+# Client reconnect delay advertised to EventSource, in milliseconds
+SSE_RETRY_MS = 10000
+
+
+class ChangeFeed:
+    """In-process publisher of warning change events for Server-Sent Events clients"""
+
+    def __init__(self, logger: Logger, max_connections: int = 500, heartbeat_interval: float = 15.0):
+        self.logger = logger
+        self.max_connections = max_connections
+        self.heartbeat_interval = heartbeat_interval
+        self.condition = threading.Condition()
+        # Event ids are only comparable within one process, so they carry its id
+        self.instance_id = secrets.token_hex(8)
+        self.seq = 0
+        self.data = None
+        self.connections = 0
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.instance_id}-{seq}"
+
+    def publish(self, version: int) -> None:
+        """Notify all connected clients that warnings changed"""
+        with self.condition:
+            self.seq += 1
+            self.data = json.dumps({'version': version})
+            self.condition.notify_all()
+        self.logger.info(f"Published warning change event {self.seq} for version {version}")
+
+    def acquire(self) -> bool:
+        """Reserve a connection slot, returning False when the process is at capacity"""
+        with self.condition:
+            if self.connections >= self.max_connections:
+                return False
+            self.connections += 1
+            return True
+
+    def release(self) -> None:
+        with self.condition:
+            self.connections -= 1
+
+    def _frame(self, seq: int, data: str) -> str:
+        return f"id: {self.event_id(seq)}\nevent: warnings\ndata: {data}\n\n"
+
+    def stream(self, last_event_id: Optional[str] = None,
+               still_valid: Callable[[], bool] = lambda: True) -> Iterator[str]:
+        """Yield SSE frames until the client disconnects or still_valid() fails"""
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        with self.condition:
+            seen = self.seq
+            data = self.data
+        # Resume: anything published since the client's last event (or in another process) is replayed
+        if last_event_id and seen and last_event_id != self.event_id(seen):
+            yield self._frame(seen, data)
+
+        while True:
+            with self.condition:
+                if self.seq == seen:
+                    self.condition.wait(self.heartbeat_interval)
+                seq, data = self.seq, self.data
+            if seq != seen:
+                seen = seq
+                yield self._frame(seq, data)
+            else:
+                if not still_valid():
+                    return
+                yield ": heartbeat\n\n"
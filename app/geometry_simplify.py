@@ -0,0 +1,106 @@
+from typing import Dict, List, Optional
+
+# Precomputed resolution levels: (Douglas-Peucker tolerance in degrees, decimals kept)
+GEOMETRY_LEVELS = {
+    'high': (0.0005, 5),
+    'medium': (0.002, 4),
+    'low': (0.01, 3),
+}
+GEOMETRY_FULL = 'full'
+GEOMETRY_NONE = 'none'
+GEOMETRY_CHOICES = (GEOMETRY_FULL, *GEOMETRY_LEVELS, GEOMETRY_NONE)
+
+
+def _perpendicular_distance_sq(point, start, end) -> float:
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return (point[0] - start[0]) ** 2 + (point[1] - start[1]) ** 2
+    t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / (dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    px = start[0] + t * dx
+    py = start[1] + t * dy
+    return (point[0] - px) ** 2 + (point[1] - py) ** 2
+
+
+def simplify_line(points: List[List[float]], tolerance: float) -> List[List[float]]:
+    """Douglas-Peucker simplification of a polyline, iterative to avoid deep recursion"""
+    if len(points) < 3:
+        return list(points)
+
+    tolerance_sq = tolerance * tolerance
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_distance = 0.0
+        index = first
+        for i in range(first + 1, last):
+            distance = _perpendicular_distance_sq(points[i], points[first], points[last])
+            if distance > max_distance:
+                max_distance = distance
+                index = i
+        if max_distance > tolerance_sq:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_ring(ring: List[List[float]], tolerance: float, decimals: int) -> Optional[List[List[float]]]:
+    """Simplify and quantize a closed ring, or return None if it collapses"""
+    if len(ring) < 4:
+        return None
+    # Split the closed ring at its midpoint so both endpoints are anchored
+    middle = len(ring) // 2
+    simplified = simplify_line(ring[:middle + 1], tolerance)[:-1] + simplify_line(ring[middle:], tolerance)
+
+    quantized = []
+    for point in simplified:
+        rounded = [round(point[0], decimals), round(point[1], decimals)]
+        if not quantized or rounded != quantized[-1]:
+            quantized.append(rounded)
+    if quantized[0] != quantized[-1]:
+        quantized.append(quantized[0])
+    return quantized if len(quantized) >= 4 else None
+
+
+def simplify_geometry(geometry: Optional[Dict], tolerance: float, decimals: int) -> Optional[Dict]:
+    """Simplify a Polygon or MultiPolygon, dropping holes and parts that collapse"""
+    if not geometry or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+        return geometry
+
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    simplified_polygons = []
+    for polygon in polygons:
+        if not polygon:
+            continue
+        exterior = simplify_ring(polygon[0], tolerance, decimals)
+        if exterior is None:
+            # Keep at least the quantized original exterior rather than losing the area
+            exterior = [[round(point[0], decimals), round(point[1], decimals)] for point in polygon[0]]
+        holes = [hole for hole in (simplify_ring(ring, tolerance, decimals) for ring in polygon[1:]) if hole]
+        simplified_polygons.append([exterior] + holes)
+
+    if geometry['type'] == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': simplified_polygons[0] if simplified_polygons else []}
+    return {'type': 'MultiPolygon', 'coordinates': simplified_polygons}
+
+
+def build_geometry_levels(geometry: Optional[Dict]) -> Dict[str, Optional[Dict]]:
+    """Precompute every simplified resolution level of a geometry"""
+    return {
+        level: simplify_geometry(geometry, tolerance, decimals)
+        for level, (tolerance, decimals) in GEOMETRY_LEVELS.items()
+    }
+
+
+def with_geometry_level(warning: Dict, level: str) -> Dict:
+    """Return a view of a warning carrying only the requested geometry level"""
+    view = {key: value for key, value in warning.items() if key != 'geometry_levels'}
+    if level == GEOMETRY_NONE:
+        view.pop('geometry', None)
+    elif level != GEOMETRY_FULL:
+        view['geometry'] = (warning.get('geometry_levels') or {}).get(level, warning.get('geometry'))
+    return view
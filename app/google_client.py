@@ -0,0 +1,133 @@
+import threading
+import time
+from logging import Logger
+from typing import Dict, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from auth_config import GOOGLE_DISCOVERY_URL
+from metrics import outbound_hook
+
+# (connect, read) timeout applied to every call to Google
+GOOGLE_REQUEST_TIMEOUT = (3.05, 10)
+
+# Connections kept open to each Google host; covers the token refresh pool and login bursts
+GOOGLE_POOL_SIZE = 20
+
+# Freshness used when the discovery document comes without a usable max-age, and how long
+# a stale copy may still be served while it is revalidated in the background
+DEFAULT_DISCOVERY_MAX_AGE = 3600
+DEFAULT_STALE_WHILE_REVALIDATE = 86400
+
+# After a failed fetch, keep serving the cached copy this long before trying again
+DISCOVERY_ERROR_RETRY = 30
+
+
+def parse_cache_control(response: requests.Response) -> Tuple[int, int]:
+    """Return (fresh_for, stale_while_revalidate) in seconds from a response's caching headers"""
+    max_age = None
+    stale_while_revalidate = DEFAULT_STALE_WHILE_REVALIDATE
+    for directive in response.headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().lower().partition('=')
+        if name in ('no-cache', 'no-store'):
+            max_age = 0
+        elif name == 'max-age' and value.isdigit() and max_age != 0:
+            max_age = int(value)
+        elif name == 'stale-while-revalidate' and value.isdigit():
+            stale_while_revalidate = int(value)
+    if max_age is None:
+        max_age = DEFAULT_DISCOVERY_MAX_AGE
+    # Time already spent in shared caches counts against freshness
+    age = response.headers.get('Age', '0')
+    fresh_for = max(0, max_age - (int(age) if age.isdigit() else 0))
+    return fresh_for, stale_while_revalidate
+
+
+class GoogleClient:
+    """Shared pooled HTTP client for Google OAuth, with a cached discovery document"""
+
+    def __init__(self, logger: Logger, discovery_url: str = GOOGLE_DISCOVERY_URL):
+        self.logger = logger
+        self.discovery_url = discovery_url
+        self.session = self._create_session()
+        self.discovery = None
+        self.fresh_until = 0.0
+        self.stale_until = 0.0
+        self.fetch_lock = threading.Lock()
+        # Guards only the flag, so requests never wait behind a background fetch
+        self.revalidate_lock = threading.Lock()
+        self.revalidating = False
+
+    def _create_session(self) -> requests.Session:
+        """Pooled session; POSTs are only retried when Google says it did not process them"""
+        retry = Retry(
+            total=3,
+            connect=3,
+            read=0,
+            backoff_factor=0.3,
+            status_forcelist=(429, 503),
+            allowed_methods=frozenset({'GET', 'POST'}),
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=GOOGLE_POOL_SIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.hooks['response'].append(outbound_hook('google')['response'])
+        return session
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', GOOGLE_REQUEST_TIMEOUT)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', GOOGLE_REQUEST_TIMEOUT)
+        return self.session.post(url, **kwargs)
+
+    def provider_config(self) -> Optional[Dict]:
+        """The discovery document, served from cache while fresh or revalidating"""
+        now = time.monotonic()
+        if self.discovery is not None and now < self.fresh_until:
+            return self.discovery
+        if self.discovery is not None and now < self.stale_until:
+            self._revalidate_in_background()
+            return self.discovery
+
+        # Nothing usable cached: one caller fetches while concurrent callers wait for it
+        with self.fetch_lock:
+            if self.discovery is None or time.monotonic() >= self.stale_until:
+                self._fetch_discovery()
+        return self.discovery
+
+    def _revalidate_in_background(self) -> None:
+        with self.revalidate_lock:
+            if self.revalidating:
+                return
+            self.revalidating = True
+        threading.Thread(target=self._revalidate, daemon=True).start()
+
+    def _revalidate(self) -> None:
+        try:
+            with self.fetch_lock:
+                self._fetch_discovery()
+        finally:
+            self.revalidating = False
+
+    def _fetch_discovery(self) -> None:
+        """Fetch the discovery document; on failure keep serving any cached copy"""
+        try:
+            response = self.get(self.discovery_url)
+            response.raise_for_status()
+            discovery = response.json()
+        except Exception as e:
+            self.logger.error(f"Error fetching Google provider config: {str(e)}")
+            if self.discovery is not None:
+                self.fresh_until = time.monotonic() + DISCOVERY_ERROR_RETRY
+                self.stale_until = max(self.stale_until, self.fresh_until)
+            return
+        fresh_for, stale_while_revalidate = parse_cache_control(response)
+        now = time.monotonic()
+        self.discovery = discovery
+        self.fresh_until = now + fresh_for
+        self.stale_until = self.fresh_until + stale_while_revalidate
+        self.logger.info(f"Cached Google provider config for {fresh_for}s")
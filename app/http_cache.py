@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+from typing import Optional
+from flask import Request, Response
+
+# Brotli is optional; without it responses fall back to gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODING_IDENTITY = 'identity'
+ENCODING_GZIP = 'gzip'
+ENCODING_BROTLI = 'br'
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def make_etag(*parts) -> str:
+    """Derive an ETag value from the given version parts"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match against an ETag, using the weak comparison it calls for"""
+    return request.if_none_match.contains_weak(etag)
+
+
+def choose_encoding(request: Request) -> str:
+    """Pick the best content encoding the client accepts"""
+    if brotli is not None and request.accept_encodings[ENCODING_BROTLI]:
+        return ENCODING_BROTLI
+    if request.accept_encodings[ENCODING_GZIP]:
+        return ENCODING_GZIP
+    return ENCODING_IDENTITY
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Encode a body with the given content encoding"""
+    if encoding == ENCODING_BROTLI:
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == ENCODING_GZIP:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def not_modified(response_class, etag: str) -> Response:
+    """Build a 304 response carrying the validator"""
+    response = response_class(status=304)
+    set_cache_headers(response, etag)
+    return response
+
+
+def set_cache_headers(response: Response, etag: str, encoding: Optional[str] = None) -> Response:
+    """Attach the validator and revalidation headers to a response
+
+    The ETag is weak: identity, gzip and br bodies of a version share it.
+    """
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    if encoding and encoding != ENCODING_IDENTITY:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def json_response(response_class, body: bytes, etag: str, encoding: str) -> Response:
+    """Build a JSON response from an already encoded body"""
+    response = response_class(body, mimetype='application/json')
+    return set_cache_headers(response, etag, encoding)
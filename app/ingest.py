@@ -0,0 +1,170 @@
+"""Standalone warning ingest worker.
+
+Runs the ZAMG fetch -> process -> save pipeline on its own schedule, outside
+the web processes. Web processes learn about new versions through Mongo.
+
+Usage: MONGODB_URI=... python ingest.py  (SIGUSR1 runs an ingest cycle immediately)
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from logging import Logger
+from typing import Callable, Optional
+from pymongo import MongoClient
+from logging_config import setup_logger
+from weather_service import WeatherService, FETCH_UPDATED, FETCH_UNCHANGED
+from warning_stream import WarningsBody
+from migrate_history import migrate_legacy_history
+from job_lease import JobLease
+from scheduler import Scheduler
+from metrics import MongoCommandMetrics, INGEST_CYCLE_DURATION, INGEST_SAVE_DURATION, serve_metrics
+
+# Seconds between ingest cycles
+INGEST_INTERVAL = int(os.environ.get('INGEST_INTERVAL', 300))
+
+# Port the standalone worker serves /metrics on
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))
+
+# Seconds to let an in-flight cycle finish on shutdown
+SHUTDOWN_TIMEOUT = 25
+
+
+class IngestWorker:
+    """Runs ingest cycles while holding the ingest lease"""
+
+    def __init__(self, weather_service: WeatherService, lease: JobLease, logger: Logger,
+                 interval: int = INGEST_INTERVAL, on_commit: Optional[Callable[[int], None]] = None):
+        self.weather_service = weather_service
+        self.lease = lease
+        self.logger = logger
+        self.interval = interval
+        self.on_commit = on_commit
+        self.history_migrated = False
+        self.stats = {
+            'cycles': 0,
+            'commits': 0,
+            'unchanged': 0,
+            'failures': 0,
+            'last_status': None,
+            'last_duration': None,
+            'last_run_at': None,
+            'last_commit_at': None
+        }
+
+    def run_cycle(self) -> None:
+        """Fetch, process and save warnings once"""
+        started = time.monotonic()
+        self.stats['last_run_at'] = datetime.utcnow()
+        self.logger.info(f"Running warning ingest at {self.stats['last_run_at']}")
+        # Taken before the fetch: a lease lost while fetching must not lend its successor's token
+        fencing_token = self.lease.fencing_token
+
+        if not self.history_migrated:
+            self.history_migrated = migrate_legacy_history(self.weather_service.db, self.logger)
+        self.weather_service.ensure_stats()
+        fetch_status, warnings = self.weather_service.fetch_warnings()
+        status = fetch_status
+        if fetch_status == FETCH_UPDATED:
+            previous_version = self.weather_service.snapshot.ingest_version
+            try:
+                with INGEST_SAVE_DURATION.time():
+                    saved = self.weather_service.save_warnings(warnings, fencing_token)
+            finally:
+                # Releases the spooled response body
+                if isinstance(warnings, WarningsBody):
+                    warnings.close()
+            if saved:
+                ingest_version = self.weather_service.snapshot.ingest_version
+                if ingest_version != previous_version:
+                    status = 'committed'
+                    self.stats['commits'] += 1
+                    self.stats['last_commit_at'] = datetime.utcnow()
+                    if self.on_commit:
+                        self.on_commit(ingest_version)
+                else:
+                    status = FETCH_UNCHANGED
+            else:
+                status = 'save_failed'
+                self.logger.error("Failed to save warnings to database")
+        elif fetch_status != FETCH_UNCHANGED:
+            self.logger.warning("No warnings received from ZAMG API")
+
+        self.stats['cycles'] += 1
+        if status == FETCH_UNCHANGED:
+            self.stats['unchanged'] += 1
+        elif status != 'committed':
+            self.stats['failures'] += 1
+        self.stats['last_status'] = status
+        self.stats['last_duration'] = time.monotonic() - started
+        INGEST_CYCLE_DURATION.observe(status, value=self.stats['last_duration'])
+        self.logger.info(f"Ingest cycle finished: {status} in {self.stats['last_duration']:.2f}s")
+        self.record_status()
+
+    def record_status(self) -> None:
+        """Publish this worker's metrics to Mongo so they can be inspected from anywhere"""
+        try:
+            self.weather_service.db.ingest_status.update_one(
+                {'_id': self.lease.name},
+                {'$set': dict(self.stats, owner=self.lease.owner, fencing_token=self.lease.fencing_token)},
+                upsert=True
+            )
+        except Exception as e:
+            self.logger.error(f"Error recording ingest status: {str(e)}")
+
+
+def add_ingest_jobs(scheduler: Scheduler, worker: IngestWorker) -> None:
+    """Schedule ingest under the worker's ingest lease"""
+    scheduler.add_job('warning_ingest', worker.run_cycle, worker.interval, lease=worker.lease)
+
+
+def main() -> None:
+    logger = setup_logger('ingest', 'ingest.log')
+    mongodb_uri = os.environ.get('MONGODB_URI')
+    if not mongodb_uri:
+        logger.critical("MongoDB URI not provided in environment variables")
+        sys.exit(1)
+
+    db_client = MongoClient(mongodb_uri, event_listeners=[MongoCommandMetrics()])
+    db = db_client.myapp
+    db_client.admin.command('ping')
+    logger.info("Successfully connected to MongoDB")
+
+    weather_service = WeatherService(db)
+    weather_service.ensure_snapshot()
+    lease = JobLease(db, logger, 'warning_ingest')
+    worker = IngestWorker(weather_service, lease, logger)
+
+    scheduler = Scheduler(logger)
+    add_ingest_jobs(scheduler, worker)
+    stop_event = threading.Event()
+
+    def shutdown(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down after the current cycle")
+        stop_event.set()
+
+    def ingest_now(signum, frame):
+        logger.info("Received SIGUSR1, running warning ingest now")
+        scheduler.run_now('warning_ingest')
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGUSR1, ingest_now)
+
+    serve_metrics(METRICS_PORT, logger)
+    lease.start()
+    scheduler.start()
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(1)
+    finally:
+        scheduler.stop(timeout=SHUTDOWN_TIMEOUT)
+        # Hand the lease over immediately instead of waiting for it to expire
+        lease.stop()
+        db_client.close()
+
+
+if __name__ == '__main__':
+    main()
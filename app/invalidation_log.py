@@ -0,0 +1,62 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from logging import Logger
+from typing import List
+from pymongo.collection import Collection
+
+# Entries published this long before the previous poll are read again, covering clock skew
+# between processes and inserts that become visible after a later-stamped one
+INVALIDATION_SKEW = 30
+
+# How long entries are kept; only the last poll window is ever read
+INVALIDATION_RETENTION = 86400
+
+
+class InvalidationLog:
+    """Cross-process log of invalidated cache keys, polled by publish time"""
+
+    def __init__(self, collection: Collection, logger: Logger, poll_interval: float = 2.0):
+        self.collection = collection
+        self.logger = logger
+        self.poll_interval = poll_interval
+        self.poll_lock = threading.Lock()
+        self.last_poll = 0.0
+        self.polled_from = datetime.utcnow()
+        # Entries of the current poll window that were already returned
+        self.seen = set()
+        self.setup_db_indexes()
+
+    def setup_db_indexes(self) -> None:
+        """Setup the publish time index, which also expires old entries"""
+        try:
+            self.collection.create_index("published_at", expireAfterSeconds=INVALIDATION_RETENTION)
+        except Exception as e:
+            self.logger.error(f"Error creating {self.collection.name} indexes: {str(e)}")
+            raise
+
+    def publish(self, key: str) -> None:
+        """Record that a key was invalidated, for other processes to pick up"""
+        self.collection.insert_one({'key': key, 'published_at': datetime.utcnow()})
+
+    def poll(self) -> List[str]:
+        """Return keys invalidated since the previous poll, at most once per poll interval
+
+        Raises if the log cannot be read; the next successful poll covers the gap.
+        """
+        if time.monotonic() - self.last_poll < self.poll_interval or not self.poll_lock.acquire(blocking=False):
+            return []
+        try:
+            self.last_poll = time.monotonic()
+            started = datetime.utcnow()
+            entries = list(self.collection.find(
+                {'published_at': {'$gte': self.polled_from - timedelta(seconds=INVALIDATION_SKEW)}},
+                {'key': 1}
+            ))
+            self.polled_from = started
+            keys = [entry['key'] for entry in entries if entry['_id'] not in self.seen]
+            # The next window starts within this one, so only its entries need remembering
+            self.seen = {entry['_id'] for entry in entries}
+            return keys
+        finally:
+            self.poll_lock.release()
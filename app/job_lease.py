@@ -0,0 +1,133 @@
+import os
+import secrets
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from logging import Logger
+from typing import Optional
+from pymongo import ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+# Fraction of the lease TTL a holder trusts its lease for, leaving room for clock skew
+LEASE_SAFETY_FACTOR = 0.8
+
+
+def claim_fence(db: Database, resource: str, fencing_token: int) -> bool:
+    """Record a fencing token for a resource, rejecting tokens older than one already used"""
+    try:
+        db.fences.find_one_and_update(
+            {'_id': resource, 'token': {'$lte': fencing_token}},
+            {'$set': {'token': fencing_token, 'claimed_at': datetime.utcnow()}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The fence exists with a newer token, so this holder has been superseded
+        return False
+
+
+class JobLease:
+    """Mongo-backed lease electing a single process to run a background job"""
+
+    def __init__(self, db: Database, logger: Logger, name: str, ttl: int = 60):
+        self.db = db
+        self.logger = logger
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.fencing_token = None
+        self.valid_until = 0.0
+        self.stop_event = threading.Event()
+        self.heartbeat_thread = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.fencing_token is not None and time.monotonic() < self.valid_until
+
+    def try_acquire(self) -> bool:
+        """Renew the lease if held, otherwise take it over if it is free or expired"""
+        now = datetime.utcnow()
+        started = time.monotonic()
+        lease = None
+        try:
+            if self.fencing_token is not None:
+                lease = self.db.job_leases.find_one_and_update(
+                    {'_id': self.name, 'owner': self.owner, 'fencing_token': self.fencing_token},
+                    {'$set': {'expires_at': now + timedelta(seconds=self.ttl), 'renewed_at': now}},
+                    return_document=ReturnDocument.AFTER
+                )
+            if lease is None:
+                lease = self.db.job_leases.find_one_and_update(
+                    {'_id': self.name, 'expires_at': {'$lt': now}},
+                    {
+                        '$set': {
+                            'owner': self.owner,
+                            'expires_at': now + timedelta(seconds=self.ttl),
+                            'acquired_at': now,
+                            'renewed_at': now
+                        },
+                        '$inc': {'fencing_token': 1}
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                self.logger.info(f"Acquired lease '{self.name}' with fencing token {lease['fencing_token']}")
+        except DuplicateKeyError:
+            # Another process holds an unexpired lease
+            lease = None
+        except Exception as e:
+            self.logger.error(f"Error renewing lease '{self.name}': {str(e)}")
+            lease = None
+
+        if lease is None:
+            if self.fencing_token is not None:
+                self.logger.warning(f"Lost lease '{self.name}'")
+            self.fencing_token = None
+            return False
+
+        self.fencing_token = lease['fencing_token']
+        self.valid_until = started + self.ttl * LEASE_SAFETY_FACTOR
+        return True
+
+    def release(self) -> None:
+        """Give up the lease so another process can take over immediately"""
+        if self.fencing_token is None:
+            return
+        try:
+            self.db.job_leases.update_one(
+                {'_id': self.name, 'owner': self.owner, 'fencing_token': self.fencing_token},
+                {'$set': {'expires_at': datetime.utcnow()}}
+            )
+            self.logger.info(f"Released lease '{self.name}'")
+        except Exception as e:
+            self.logger.error(f"Error releasing lease '{self.name}': {str(e)}")
+        self.fencing_token = None
+
+    def start(self) -> None:
+        """Start a heartbeat thread that keeps competing for and renewing the lease"""
+        if self.heartbeat_thread is None:
+            self.stop_event.clear()
+            self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self.heartbeat_thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.heartbeat_thread = None
+        self.release()
+
+    def _heartbeat_loop(self) -> None:
+        while not self.stop_event.is_set():
+            self.try_acquire()
+            self.stop_event.wait(self.ttl / 3)
+
+    def wait_for_leadership(self, timeout: Optional[float] = None) -> bool:
+        """Block until this process holds the lease, the timeout passes or the lease is stopped"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.is_leader and not self.stop_event.is_set():
+            remaining = self.ttl / 3 if deadline is None else min(self.ttl / 3, deadline - time.monotonic())
+            if remaining <= 0:
+                break
+            self.stop_event.wait(remaining)
+        return self.is_leader
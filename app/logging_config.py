@@ -1,21 +1,68 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pythonjsonlogger import jsonlogger
 
 # Get log directory from environment variable with fallback
 LOG_DIR = os.environ.get('LOG_DIR', '/app/logs')
 
+# Fraction of hot per-request messages (logged with extra=SAMPLED) that are kept
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+
+# Records waiting for the writer thread; beyond this new records are dropped
+LOG_QUEUE_SIZE = 10000
+
+# Pass as extra= to mark a record as sampled at LOG_SAMPLE_RATE
+SAMPLED = {'sampled': True}
+
+# One writer thread per logger, stopped (and drained) at exit
+_listeners = {}
+
+
+class SampleFilter(logging.Filter):
+    """Keep only a fraction of records marked as sampled; warnings and above always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False) or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Hand records to the writer thread without formatting them in the caller"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, so pass immutable values as args
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
 def setup_logger(name, log_file, level=logging.INFO):
-    """Function to setup a logger with file and console handlers"""
+    """Function to setup a logger writing JSON lines through a background thread"""
     # Ensure we use the environment-based log directory
     log_path = os.path.join(LOG_DIR, log_file)
-    
+
     # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+    formatter = jsonlogger.JsonFormatter(
+        '%(asctime)s %(name)s %(levelname)s %(filename)s %(lineno)d %(message)s'
     )
-    
+
     # Create file handler with daily rotation
     file_handler = RotatingFileHandler(
         log_path,
@@ -23,25 +70,37 @@ def setup_logger(name, log_file, level=logging.INFO):
         backupCount=30
     )
     file_handler.setFormatter(formatter)
-    
+
     # Create console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    
+
+    # Replace any writer thread from an earlier setup of the same logger
+    if name in _listeners:
+        _listeners.pop(name).stop()
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    _listeners[name] = listener
+
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter(LOG_SAMPLE_RATE))
+
     # Create logger
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    
+
     # Remove existing handlers if any
     logger.handlers = []
-    
-    # Add handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+
+    # Callers only pay for enqueueing a record
+    logger.addHandler(queue_handler)
+
     return logger
 
-def log_to_file(logger, message, level=logging.INFO):
-    """Helper function to log messages with timestamp"""
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    logger.log(level, f"[{timestamp}] {message}")
+def stop_listeners():
+    """Flush queued records and stop every writer thread"""
+    while _listeners:
+        _listeners.popitem()[1].stop()
+
+atexit.register(stop_listeners)
@@ -0,0 +1,297 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Recording only appends to a deque (atomic in CPython), so request threads never
+wait on a lock. Whoever finds the backlog large enough, or the scraper, folds
+it into the totals under a lock that recorders only ever try, never wait for.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import Logger
+from typing import Dict, Iterable, Optional, Tuple
+from pymongo import monitoring
+
+# Pending observations per metric before a recorder folds them in
+DRAIN_THRESHOLD = 1000
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.pending = deque()
+        self.drain_lock = threading.Lock()
+        _registry.append(self)
+
+    def _record(self, labels: Tuple, value: float) -> None:
+        self.pending.append((labels, value))
+        if len(self.pending) >= DRAIN_THRESHOLD and self.drain_lock.acquire(blocking=False):
+            try:
+                self._drain()
+            finally:
+                self.drain_lock.release()
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                labels, value = self.pending.popleft()
+            except IndexError:
+                return
+            self._apply(labels, value)
+
+    @abstractmethod
+    def _apply(self, labels: Tuple, value: float) -> None:
+        """Fold one pending observation into the totals (caller holds the drain lock)"""
+
+    @abstractmethod
+    def _samples(self) -> Iterable[str]:
+        """Yield the exposition lines for the current totals"""
+
+    def render(self) -> str:
+        with self.drain_lock:
+            self._drain()
+            lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+            lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._record(labels, amount)
+
+    def _apply(self, labels: Tuple, value: float) -> None:
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def _samples(self) -> Iterable[str]:
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Last observed value"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def set(self, *labels, value: float) -> None:
+        # A single dict assignment is atomic, so gauges skip the pending queue
+        self._apply(labels, value)
+
+    def _apply(self, labels: Tuple, value: float) -> None:
+        self.values[labels] = value
+
+    def _samples(self) -> Iterable[str]:
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.values = {}
+
+    def observe(self, *labels, value: float) -> None:
+        self._record(labels, value)
+
+    def time(self, *labels) -> 'Timer':
+        return Timer(self, labels)
+
+    def _apply(self, labels: Tuple, value: float) -> None:
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = state[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def _samples(self) -> Iterable[str]:
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(total)}"
+            yield f"{self.name}_count{label_text} {count}"
+
+
+class Timer:
+    """Context manager observing the time spent in its block"""
+
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(*self.labels, value=time.perf_counter() - self.started)
+
+
+def render_metrics() -> str:
+    """Render every registered metric in the Prometheus text format"""
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+
+# HTTP server side
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by route', ('method', 'route', 'status')
+)
+HTTP_REQUEST_MONGO_COMMANDS = Histogram(
+    'http_request_mongo_commands', 'Mongo round trips made while handling a request', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50)
+)
+
+# Mongo
+MONGO_COMMAND_DURATION = Histogram(
+    'mongo_command_duration_seconds', 'Mongo command round trip time', ('command', 'collection')
+)
+MONGO_COMMAND_FAILURES = Counter(
+    'mongo_command_failures_total', 'Mongo commands that failed', ('command', 'collection')
+)
+
+# Outbound HTTP
+OUTBOUND_REQUEST_DURATION = Histogram(
+    'outbound_request_duration_seconds', 'Time until response headers from an external service',
+    ('service', 'status')
+)
+
+# Ingest
+INGEST_CYCLE_DURATION = Histogram(
+    'ingest_cycle_duration_seconds', 'Duration of a warning ingest cycle', ('status',)
+)
+INGEST_SAVE_DURATION = Histogram(
+    'ingest_save_duration_seconds', 'Time spent in save_warnings'
+)
+INGEST_WARNINGS = Gauge(
+    'ingest_warnings', 'Warnings in the most recent fetched response'
+)
+INGEST_PAYLOAD_BYTES = Gauge(
+    'ingest_payload_bytes', 'Size of the most recent fetched response body'
+)
+
+# Token refresh
+TOKEN_REFRESHES = Counter(
+    'token_refreshes_total', 'Google token refresh attempts', ('result',)
+)
+TOKEN_REFRESH_BATCH_DURATION = Histogram(
+    'token_refresh_batch_duration_seconds', 'Time to refresh one batch of expiring tokens'
+)
+
+# Mongo commands issued by the current request (greenlet-local under gevent)
+_request_commands = threading.local()
+
+
+def reset_request_mongo_commands() -> None:
+    _request_commands.count = 0
+
+
+def request_mongo_commands() -> int:
+    return getattr(_request_commands, 'count', 0)
+
+
+def outbound_hook(service: str) -> Dict:
+    """requests hooks= argument recording the response time for an external service"""
+    def record(response, *args, **kwargs):
+        OUTBOUND_REQUEST_DURATION.observe(service, response.status_code, value=response.elapsed.total_seconds())
+    return {'response': record}
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo listener timing every command per collection"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def started(self, event):
+        _request_commands.count = getattr(_request_commands, 'count', 0) + 1
+        collection = event.command.get('collection' if event.command_name == 'getMore' else event.command_name)
+        if not isinstance(collection, str):
+            collection = ''
+        self.collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), '')
+        MONGO_COMMAND_DURATION.observe(event.command_name, collection, value=event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), '')
+        MONGO_COMMAND_DURATION.observe(event.command_name, collection, value=event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.inc(event.command_name, collection)
+
+
+def serve_metrics(port: int, logger: Logger) -> Optional[ThreadingHTTPServer]:
+    """Expose /metrics on a background HTTP server for processes without a web app"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render_metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"Error starting metrics server on port {port}: {str(e)}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+    return server
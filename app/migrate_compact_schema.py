@@ -0,0 +1,69 @@
+"""One-off migration of warning documents to the compact storage schema.
+
+Moves inline raw_data out of current_warnings and the legacy
+historical_warnings collection into compressed warning_payloads documents,
+in _id-ordered batches so memory use does not depend on collection size.
+
+Usage: MONGODB_URI=... python migrate_compact_schema.py [batch_size]
+"""
+import os
+import sys
+from pymongo import MongoClient, UpdateOne
+from pymongo.collection import Collection
+from logging_config import setup_logger
+from warning_payloads import compute_content_hash, payload_upsert
+
+logger = setup_logger('migration', 'migration.log')
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def migrate_collection(collection: Collection, payloads: Collection, batch_size: int) -> int:
+    """Move raw_data of one collection into warning_payloads, returning the documents rewritten"""
+    migrated = 0
+    last_id = None
+    while True:
+        query = {'raw_data': {'$exists': True}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(collection.find(
+            query,
+            {'_id': 1, 'warning_id': 1, 'content_hash': 1, 'raw_data': 1}
+        ).sort('_id', 1).limit(batch_size))
+        if not batch:
+            return migrated
+
+        payload_operations = []
+        document_operations = []
+        for document in batch:
+            content_hash = document.get('content_hash') or compute_content_hash(document['raw_data'])
+            payload_operations.append(payload_upsert(document['warning_id'], content_hash, document['raw_data']))
+            document_operations.append(UpdateOne(
+                {'_id': document['_id']},
+                {'$set': {'content_hash': content_hash}, '$unset': {'raw_data': ""}}
+            ))
+
+        # Payloads are written first so no document loses its raw data if the run is interrupted
+        payloads.bulk_write(payload_operations, ordered=False)
+        collection.bulk_write(document_operations, ordered=False)
+        migrated += len(batch)
+        last_id = batch[-1]['_id']
+        logger.info(f"Migrated {migrated} documents in {collection.name}")
+
+
+def main() -> None:
+    mongodb_uri = os.environ.get('MONGODB_URI')
+    if not mongodb_uri:
+        logger.critical("MongoDB URI not provided in environment variables")
+        sys.exit(1)
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE
+
+    db = MongoClient(mongodb_uri).myapp
+    db.warning_payloads.create_index([("warning_id", 1), ("content_hash", 1)], unique=True)
+    for collection in (db.current_warnings, db.historical_warnings):
+        count = migrate_collection(collection, db.warning_payloads, batch_size)
+        logger.info(f"Finished {collection.name}: {count} documents rewritten")
+
+
+if __name__ == '__main__':
+    main()
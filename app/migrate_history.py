@@ -0,0 +1,145 @@
+"""One-off fold of the legacy historical_warnings snapshots into warning_history.
+
+historical_warnings held a full copy of every current warning per ingest. Each
+warning's snapshots are collapsed into its warning_history document: the
+latest state, plus one revision per change between successive snapshots.
+Warnings are folded in batches and removed from the legacy collection as they
+go, so an interrupted run resumes where it stopped; the collection is dropped
+once empty. The ingest worker runs this before its first cycle.
+
+Usage: MONGODB_URI=... python migrate_history.py [batch_size]
+"""
+import os
+import sys
+from logging import Logger
+from typing import Dict, List, Tuple
+from pymongo import MongoClient, UpdateOne
+from pymongo.database import Database
+from logging_config import setup_logger
+from warning_payloads import compute_content_hash, payload_upsert
+from weather_service import HISTORY_FIELDS, MAX_HISTORY_REVISIONS
+
+LEGACY_COLLECTION = 'historical_warnings'
+
+# Warnings folded per batch
+DEFAULT_BATCH_SIZE = 200
+
+
+def fold_snapshots(warning_id, snapshots: List[Dict], active_ids: set) -> Tuple[UpdateOne, List[UpdateOne]]:
+    """Build the warning_history upsert, and payload upserts, for one warning's distinct states"""
+    payload_operations = []
+    revisions = []
+    for previous, state in zip(snapshots, snapshots[1:]):
+        revisions.append({
+            'recorded_at': state['created_at'],
+            'content_hash': previous.get('content_hash'),
+            'previous': {
+                field: previous.get(field) for field in HISTORY_FIELDS
+                if previous.get(field) != state.get(field)
+            }
+        })
+    for state in snapshots:
+        if state.get('raw_data') and state.get('content_hash'):
+            payload_operations.append(payload_upsert(warning_id, state['content_hash'], state['raw_data']))
+
+    latest = snapshots[-1]
+    fields = {field: latest.get(field) for field in HISTORY_FIELDS}
+    fields.update(content_hash=latest.get('content_hash'), updated_at=latest['last_seen'])
+    if warning_id not in active_ids:
+        # The warning left the feed after its last snapshot
+        fields['expired_at'] = latest['last_seen']
+    # A history document written since the upgrade already holds the newer state
+    update = {'$setOnInsert': fields, '$min': {'created_at': snapshots[0]['created_at']}}
+    if revisions:
+        update['$push'] = {'revisions': {
+            '$each': revisions[-MAX_HISTORY_REVISIONS:],
+            '$position': 0,
+            '$slice': -MAX_HISTORY_REVISIONS
+        }}
+    return UpdateOne({'warning_id': warning_id}, update, upsert=True), payload_operations
+
+
+def migrate_legacy_history(db: Database, logger: Logger, batch_size: int = DEFAULT_BATCH_SIZE) -> bool:
+    """Fold historical_warnings into warning_history and drop it, returning True when none is left"""
+    try:
+        if LEGACY_COLLECTION not in db.list_collection_names():
+            return True
+        legacy = db[LEGACY_COLLECTION]
+        legacy.create_index([("warning_id", 1), ("created_at", 1)])
+        active_ids = {doc['warning_id'] for doc in db.current_warnings.find({}, {'_id': 0, 'warning_id': 1})}
+
+        snapshots = legacy.find(
+            {},
+            {'_id': 0, 'geometry_levels': 0},
+            batch_size=DEFAULT_BATCH_SIZE
+        ).sort([('warning_id', 1), ('created_at', 1)])
+
+        batch_ids = []
+        operations = []
+        payload_operations = []
+        folded = 0
+
+        def add(warning_id, states: List[Dict]) -> None:
+            nonlocal folded
+            history, payloads = fold_snapshots(warning_id, states, active_ids)
+            operations.append(history)
+            payload_operations.extend(payloads)
+            batch_ids.append(warning_id)
+            folded += 1
+            if len(batch_ids) >= batch_size:
+                flush()
+
+        def flush() -> None:
+            if payload_operations:
+                db.warning_payloads.bulk_write(payload_operations, ordered=False)
+            db.warning_history.bulk_write(operations, ordered=False)
+            # Removed only once written, so an interrupted run resumes with the remaining warnings
+            legacy.delete_many({'warning_id': {'$in': batch_ids}})
+            logger.info(f"Folded {folded} legacy warnings into warning_history")
+            batch_ids.clear()
+            operations.clear()
+            payload_operations.clear()
+
+        warning_id = None
+        states = []
+        for snapshot in snapshots:
+            if snapshot.get('raw_data') and not snapshot.get('content_hash'):
+                snapshot['content_hash'] = compute_content_hash(snapshot['raw_data'])
+            snapshot['last_seen'] = snapshot.get('updated_at') or snapshot['created_at']
+            if snapshot['warning_id'] != warning_id:
+                if states:
+                    add(warning_id, states)
+                warning_id = snapshot['warning_id']
+                states = [snapshot]
+            elif all(snapshot.get(field) == states[-1].get(field) for field in HISTORY_FIELDS):
+                # Unchanged re-archive of the same state
+                states[-1]['last_seen'] = snapshot['last_seen']
+            else:
+                states.append(snapshot)
+        if states:
+            add(warning_id, states)
+        if batch_ids:
+            flush()
+
+        legacy.drop()
+        logger.info(f"Dropped {LEGACY_COLLECTION} after folding {folded} warnings")
+        return True
+    except Exception as e:
+        logger.error(f"Error folding legacy warning history: {str(e)}")
+        return False
+
+
+def main() -> None:
+    logger = setup_logger('migration', 'migration.log')
+    mongodb_uri = os.environ.get('MONGODB_URI')
+    if not mongodb_uri:
+        logger.critical("MongoDB URI not provided in environment variables")
+        sys.exit(1)
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE
+
+    if not migrate_legacy_history(MongoClient(mongodb_uri).myapp, logger, batch_size):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
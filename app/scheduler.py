@@ -0,0 +1,142 @@
+import random
+import threading
+import time
+from datetime import datetime
+from logging import Logger
+from typing import Callable, Dict, Optional
+from job_lease import JobLease
+
+# Seconds before retrying a failed job, doubled per consecutive failure
+RETRY_BASE = 30
+MAX_BACKOFF = 3600
+
+
+class Job:
+    """A periodic background job and its run statistics"""
+
+    def __init__(self, name: str, func: Callable[[], None], interval: float, jitter: float,
+                 lease: Optional[JobLease], next_interval: Optional[Callable[[], float]],
+                 max_backoff: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.lease = lease
+        self.next_interval = next_interval
+        self.max_backoff = max_backoff
+        self.wakeup = threading.Event()
+        self.run_requested = False
+        self.thread = None
+        self.next_run = time.monotonic()
+        self.last_run_at = None
+        self.last_duration = None
+        self.last_success_at = None
+        self.last_error = None
+        self.runs = 0
+        self.failures = 0
+
+    def delay(self) -> float:
+        """Seconds until the next run after a successful one"""
+        interval = self.next_interval() if self.next_interval else self.interval
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def backoff(self) -> float:
+        return min(RETRY_BASE * 2 ** (self.failures - 1), self.max_backoff)
+
+    def status(self) -> Dict:
+        return {
+            'leader': self.lease.is_leader if self.lease else True,
+            'runs': self.runs,
+            'consecutive_failures': self.failures,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_success_at': self.last_success_at.isoformat() if self.last_success_at else None,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+            'next_run_in': round(self.next_run - time.monotonic(), 1),
+            # How far past its due time the job is; large values mean it is stuck
+            'lag': round(max(0.0, time.monotonic() - self.next_run), 1)
+        }
+
+
+class Scheduler:
+    """Runs background jobs on jittered intervals with backoff, run-now triggers and clean shutdown"""
+
+    def __init__(self, logger: Logger):
+        self.logger = logger
+        self.jobs = {}
+        self.stopping = threading.Event()
+
+    def add_job(self, name: str, func: Callable[[], None], interval: float, jitter: float = 0.1,
+                lease: Optional[JobLease] = None, next_interval: Optional[Callable[[], float]] = None,
+                max_backoff: float = MAX_BACKOFF) -> Job:
+        """Register a job; with a lease it only runs while this process holds it"""
+        job = Job(name, func, interval, jitter, lease, next_interval, max_backoff)
+        self.jobs[name] = job
+        return job
+
+    def start(self) -> None:
+        self.stopping.clear()
+        for job in self.jobs.values():
+            if job.thread is None:
+                job.thread = threading.Thread(target=self._run_job, args=(job,), name=f"job-{job.name}", daemon=True)
+                job.thread.start()
+                self.logger.info(f"Started background job '{job.name}'")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Wake every job and wait for in-flight runs to finish"""
+        self.stopping.set()
+        for job in self.jobs.values():
+            job.wakeup.set()
+        deadline = time.monotonic() + timeout
+        for job in self.jobs.values():
+            if job.thread is not None:
+                job.thread.join(max(0.0, deadline - time.monotonic()))
+                if job.thread.is_alive():
+                    self.logger.warning(f"Background job '{job.name}' did not stop within {timeout}s")
+                job.thread = None
+        self.logger.info("Scheduler stopped")
+
+    def run_now(self, name: str) -> bool:
+        """Run a job as soon as possible instead of waiting for its next interval"""
+        job = self.jobs.get(name)
+        if job is None:
+            return False
+        job.run_requested = True
+        job.wakeup.set()
+        return True
+
+    def status(self) -> Dict:
+        return {name: job.status() for name, job in self.jobs.items()}
+
+    def _run_job(self, job: Job) -> None:
+        while not self.stopping.is_set():
+            job.wakeup.wait(max(0.0, job.next_run - time.monotonic()))
+            job.wakeup.clear()
+            if self.stopping.is_set():
+                break
+            if not job.run_requested and time.monotonic() < job.next_run:
+                continue
+            job.run_requested = False
+
+            if job.lease is not None and not job.lease.is_leader:
+                # Check back once the lease could have changed hands
+                job.next_run = time.monotonic() + min(job.interval, job.lease.ttl / 3)
+                continue
+
+            started = time.monotonic()
+            job.last_run_at = datetime.utcnow()
+            try:
+                job.func()
+                job.failures = 0
+                job.last_error = None
+                job.last_success_at = datetime.utcnow()
+                delay = job.delay()
+            except Exception as e:
+                job.failures += 1
+                job.last_error = str(e)
+                delay = job.backoff()
+                self.logger.error(f"Error in background job '{job.name}': {str(e)}", exc_info=True)
+
+            job.runs += 1
+            job.last_duration = round(time.monotonic() - started, 3)
+            job.next_run = started + delay if job.failures == 0 else time.monotonic() + delay
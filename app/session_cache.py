@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from logging import Logger
+from pymongo.database import Database
+from invalidation_log import InvalidationLog
+
+
+class SessionCache:
+    """Bounded TTL/LRU cache of validated sessions with cross-process revocation"""
+
+    def __init__(self, db: Database, logger: Logger, max_entries: int = 10000,
+                 ttl: int = 300, poll_interval: float = 2.0):
+        self.db = db
+        self.logger = logger
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        # google_id -> (session_token, expires_at); a user has one session token at a time
+        self.entries = OrderedDict()
+        # Bumped on every invalidation, so a lookup can tell whether a revocation overtook it
+        self.generation = 0
+        # google_id -> generation of its latest invalidation, bounded like the entries
+        self.revoked = OrderedDict()
+        self.forgotten_generation = 0
+        self.revocations = InvalidationLog(db.session_revocations, logger, poll_interval)
+
+    def is_valid(self, google_id: str, session_token: str) -> bool:
+        """Check a session, consulting the users collection only on a cache miss"""
+        if not google_id or not session_token:
+            return False
+
+        self._poll_revocations()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(google_id)
+            if entry and entry[0] == session_token and entry[1] > now:
+                self.entries.move_to_end(google_id)
+                return True
+            lookup_generation = self.generation
+
+        user = self.db.users.find_one(
+            {'google_id': google_id, 'session_token': session_token},
+            {'_id': 1}
+        )
+        if user is None:
+            with self.lock:
+                self.entries.pop(google_id, None)
+            return False
+
+        with self.lock:
+            # The lookup may predate a logout that was applied while it ran; don't cache it then
+            if max(self.revoked.get(google_id, 0), self.forgotten_generation) > lookup_generation:
+                return True
+            self.entries[google_id] = (session_token, now + self.ttl)
+            self.entries.move_to_end(google_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return True
+
+    def invalidate(self, google_id: str) -> None:
+        """Drop a user's cached session in this process"""
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(google_id, None)
+            self.revoked[google_id] = self.generation
+            self.revoked.move_to_end(google_id)
+            while len(self.revoked) > self.max_entries:
+                _, generation = self.revoked.popitem(last=False)
+                self.forgotten_generation = max(self.forgotten_generation, generation)
+
+    def revoke(self, google_id: str) -> None:
+        """Invalidate a user's session here and broadcast the revocation to other processes"""
+        self.invalidate(google_id)
+        try:
+            self.revocations.publish(google_id)
+        except Exception as e:
+            self.logger.error(f"Error broadcasting session revocation: {str(e)}")
+
+    def _poll_revocations(self) -> None:
+        """Apply revocations published by other processes, at most once per poll interval"""
+        try:
+            for google_id in self.revocations.poll():
+                self.invalidate(google_id)
+        except Exception as e:
+            # Fail closed: without the revocation log we cannot trust cached entries
+            self.logger.error(f"Error polling session revocations: {str(e)}")
+            with self.lock:
+                self.generation += 1
+                self.forgotten_generation = self.generation
+                self.entries.clear()
@@ -0,0 +1,147 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Grid cell size in degrees; Austria spans roughly 10 x 3 degrees
+GRID_CELL_SIZE = 0.25
+
+BBox = Tuple[float, float, float, float]
+
+
+def geometry_polygons(geometry: Optional[Dict]) -> List[List[List[List[float]]]]:
+    """Return the polygons (lists of rings) of a Polygon or MultiPolygon geometry"""
+    if not geometry:
+        return []
+    if geometry.get('type') == 'Polygon':
+        return [geometry.get('coordinates') or []]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry.get('coordinates') or []
+    return []
+
+
+def geometry_bbox(geometry: Optional[Dict]) -> Optional[BBox]:
+    """Compute the (min_lon, min_lat, max_lon, max_lat) bounding box of a geometry"""
+    lons = []
+    lats = []
+    for polygon in geometry_polygons(geometry):
+        if polygon:
+            lons.extend(point[0] for point in polygon[0])
+            lats.extend(point[1] for point in polygon[0])
+    if not lons:
+        return None
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def point_in_ring(lon: float, lat: float, ring: List[List[float]]) -> bool:
+    """Ray-casting test of a point against a single linear ring"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def point_in_geometry(lon: float, lat: float, geometry: Optional[Dict]) -> bool:
+    """Test whether a point lies inside a Polygon or MultiPolygon, honouring holes"""
+    for polygon in geometry_polygons(geometry):
+        if polygon and point_in_ring(lon, lat, polygon[0]):
+            if not any(point_in_ring(lon, lat, hole) for hole in polygon[1:]):
+                return True
+    return False
+
+
+def _segments_intersect(p1, p2, p3, p4) -> bool:
+    def orientation(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+    d1 = orientation(p3, p4, p1)
+    d2 = orientation(p3, p4, p2)
+    d3 = orientation(p1, p2, p3)
+    d4 = orientation(p1, p2, p4)
+    return ((d1 > 0) != (d2 > 0)) and ((d3 > 0) != (d4 > 0))
+
+
+def geometry_intersects_bbox(geometry: Optional[Dict], bbox: BBox) -> bool:
+    """Exact test whether a polygonal geometry intersects an axis-aligned box"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    corners = [(min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat), (min_lon, max_lat)]
+    edges = [(corners[i], corners[(i + 1) % 4]) for i in range(4)]
+
+    for polygon in geometry_polygons(geometry):
+        if not polygon:
+            continue
+        # A polygon vertex inside the box
+        for point in polygon[0]:
+            if min_lon <= point[0] <= max_lon and min_lat <= point[1] <= max_lat:
+                return True
+        # The box lies inside the polygon
+        if point_in_geometry(corners[0][0], corners[0][1], {'type': 'Polygon', 'coordinates': polygon}):
+            return True
+        # Polygon and box edges cross
+        for ring in polygon:
+            for i in range(len(ring) - 1):
+                for edge_start, edge_end in edges:
+                    if _segments_intersect(ring[i], ring[i + 1], edge_start, edge_end):
+                        return True
+    return False
+
+
+def _bboxes_overlap(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class SpatialIndex:
+    """Uniform grid over warning bounding boxes with exact polygon tests"""
+
+    def __init__(self, items: List[Dict], cell_size: float = GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.entries = []
+        self.cells = {}
+        for item in items:
+            bbox = geometry_bbox(item.get('geometry'))
+            if bbox is None:
+                continue
+            index = len(self.entries)
+            self.entries.append((bbox, item))
+            for cell in self._cells_for_bbox(bbox):
+                self.cells.setdefault(cell, []).append(index)
+
+    def _cell(self, lon: float, lat: float) -> Tuple[int, int]:
+        return int(lon // self.cell_size), int(lat // self.cell_size)
+
+    def _cells_for_bbox(self, bbox: BBox) -> Iterator[Tuple[int, int]]:
+        min_x, min_y = self._cell(bbox[0], bbox[1])
+        max_x, max_y = self._cell(bbox[2], bbox[3])
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                yield x, y
+
+    def query_point(self, lon: float, lat: float) -> List[Dict]:
+        """Return items whose geometry contains the point"""
+        results = []
+        for index in self.cells.get(self._cell(lon, lat), []):
+            bbox, item = self.entries[index]
+            if bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3] \
+                    and point_in_geometry(lon, lat, item.get('geometry')):
+                results.append(item)
+        return results
+
+    def query_bbox(self, bbox: BBox) -> List[Dict]:
+        """Return items whose geometry intersects the box"""
+        candidates = set()
+        # Large boxes would enumerate many empty cells, so scan entries directly instead
+        cell_count = ((bbox[2] - bbox[0]) / self.cell_size + 1) * ((bbox[3] - bbox[1]) / self.cell_size + 1)
+        if cell_count > len(self.entries):
+            candidates = set(range(len(self.entries)))
+        else:
+            for cell in self._cells_for_bbox(bbox):
+                candidates.update(self.cells.get(cell, []))
+
+        results = []
+        for index in sorted(candidates):
+            item_bbox, item = self.entries[index]
+            if _bboxes_overlap(item_bbox, bbox) and geometry_intersects_bbox(item.get('geometry'), bbox):
+                results.append(item)
+        return results
@@ -3,12 +3,34 @@ import base64
 import os
 from datetime import datetime, timedelta
 import requests
-import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from logging import Logger
+from pymongo import UpdateOne
+from auth_config import GOOGLE_TOKEN_URL
+from job_lease import claim_fence
+from google_client import GOOGLE_REQUEST_TIMEOUT
+from metrics import TOKEN_REFRESHES, TOKEN_REFRESH_BATCH_DURATION
+
+# Tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_LEAD = 300
+# Lifetime assumed when Google omits expires_in
+DEFAULT_TOKEN_LIFETIME = 3600
+
+# Concurrent refresh calls and the size of each batched write-back
+TOKEN_REFRESH_WORKERS = int(os.environ.get('TOKEN_REFRESH_WORKERS', 8))
+TOKEN_BULK_WRITE_SIZE = 500
+
+# Bounds on how long to wait between checks for expiring tokens
+MIN_REFRESH_SLEEP = 30
+MAX_REFRESH_SLEEP = 3600
+
+# Backoff before retrying a user whose refresh failed
+REFRESH_RETRY_BASE = 60
+REFRESH_RETRY_MAX = 6 * 3600
 
 class TokenManager:
-    def __init__(self, logger: Logger, secret_key=None):
+    def __init__(self, logger: Logger, http_session: requests.Session, secret_key=None):
         if secret_key is None:
             secret_key = os.environ.get('ENCRYPTION_KEY')
             if not secret_key:
@@ -22,8 +44,9 @@ class TokenManager:
             self.fernet = Fernet(secret_key)
         
         self.logger = logger
-        self.refresh_thread = None
-        self.stop_refresh = False
+        # The shared GoogleClient session, so token refreshes get its pooling and retry policy
+        self.http_session = http_session
+        self.refresh_pool = ThreadPoolExecutor(max_workers=TOKEN_REFRESH_WORKERS, thread_name_prefix='token-refresh')
 
     def encrypt_token(self, token: str) -> str:
         """Encrypt a token string."""
@@ -37,78 +60,134 @@ class TokenManager:
             self.logger.error(f"Error decrypting token: {e}")
             return None
 
-    def start_token_refresh_thread(self, db, google_config):
-        """Start a background thread to refresh tokens"""
-        if self.refresh_thread is None:
-            self.stop_refresh = False
-            self.refresh_thread = threading.Thread(
-                target=self._token_refresh_loop,
-                args=(db, google_config),
-                daemon=True
-            )
-            self.refresh_thread.start()
-            self.logger.info("Token refresh thread started")
-
-    def stop_token_refresh_thread(self):
-        """Stop the token refresh thread"""
-        self.stop_refresh = True
-        if self.refresh_thread:
-            self.refresh_thread = None
-            self.logger.info("Token refresh thread stopped")
-
-    def _token_refresh_loop(self, db, google_config):
-        """Background loop to refresh tokens"""
-        while not self.stop_refresh:
-            try:
-                # Find users with refresh tokens that need to be refreshed
-                users = db.users.find({'refresh_token': {'$exists': True}})
-                
-                for user in users:
-                    try:
-                        # Decrypt refresh token
-                        refresh_token = self.decrypt_token(user['refresh_token'])
-                        if not refresh_token:
-                            continue
-
-                        # Request new access token
-                        new_tokens = self._refresh_google_token(
-                            refresh_token,
-                            google_config['client_id'],
-                            google_config['client_secret']
-                        )
-
-                        if new_tokens and 'refresh_token' in new_tokens:
-                            # Encrypt and store new refresh token
-                            encrypted_token = self.encrypt_token(new_tokens['refresh_token'])
-                            db.users.update_one(
-                                {'_id': user['_id']},
-                                {'$set': {
-                                    'refresh_token': encrypted_token,
-                                    'token_updated_at': datetime.utcnow()
-                                }}
-                            )
-                            self.logger.info(f"Refreshed token for user: {user['email']}")
-
-                    except Exception as e:
-                        self.logger.error(f"Error refreshing token for user {user.get('email')}: {e}")
-
-            except Exception as e:
-                self.logger.error(f"Error in token refresh loop: {e}")
-
-            # Sleep for 1 hour before next refresh check
-            time.sleep(3600)
+    def token_expiry(self, tokens: dict) -> datetime:
+        """When an access token from a Google token response expires"""
+        return datetime.utcnow() + timedelta(seconds=int(tokens.get('expires_in', DEFAULT_TOKEN_LIFETIME)))
+
+    def setup_indexes(self, db) -> None:
+        """Index the expiry that drives which tokens are refreshed next"""
+        try:
+            db.users.create_index([('token_expires_at', 1)])
+        except Exception as e:
+            self.logger.error(f"Error creating token expiry index: {e}")
+
+    def refresh_expiring_tokens(self, db, google_config, fencing_token: int) -> None:
+        """Refresh every token expiring within the lead time, writing results back in batches"""
+        if fencing_token is None:
+            self.logger.warning("Token refresh lease not held, skipping token refresh")
+            return
+        horizon = datetime.utcnow() + timedelta(seconds=TOKEN_REFRESH_LEAD)
+        # Users stored before expiries were tracked have no token_expires_at and are due now
+        users = db.users.find(
+            {
+                'refresh_token': {'$exists': True},
+                '$or': [{'token_expires_at': {'$lte': horizon}}, {'token_expires_at': None}]
+            },
+            {'email': 1, 'refresh_token': 1, 'token_refresh_failures': 1}
+        ).sort('token_expires_at', 1)
+        
+        started = time.perf_counter()
+        futures = [self.refresh_pool.submit(self._refresh_user_token, user, google_config) for user in users]
+        if not futures:
+            return
+        
+        updates = []
+        refreshed = 0
+        for future in as_completed(futures):
+            update, success = future.result()
+            refreshed += success
+            TOKEN_REFRESHES.inc('success' if success else 'failure')
+            updates.append(update)
+            if len(updates) >= TOKEN_BULK_WRITE_SIZE:
+                if not self._write_token_updates(db, updates, fencing_token):
+                    return
+                updates = []
+        if not self._write_token_updates(db, updates, fencing_token):
+            return
+        TOKEN_REFRESH_BATCH_DURATION.observe(value=time.perf_counter() - started)
+        self.logger.info(f"Refreshed {refreshed} of {len(futures)} expiring tokens")
+
+    def _refresh_user_token(self, user: dict, google_config: dict):
+        """Refresh one user's token, returning the write to apply and whether it succeeded"""
+        now = datetime.utcnow()
+        new_tokens = None
+        try:
+            refresh_token = self.decrypt_token(user['refresh_token'])
+            if refresh_token:
+                new_tokens = self._refresh_google_token(
+                    refresh_token,
+                    google_config['client_id'],
+                    google_config['client_secret']
+                )
+        except Exception as e:
+            self.logger.error(f"Error refreshing token for user {user.get('email')}: {e}")
+
+        if not new_tokens:
+            # Failed refreshes are rescheduled with exponential backoff by pushing out their expiry
+            failures = user.get('token_refresh_failures', 0) + 1
+            backoff = min(REFRESH_RETRY_BASE * 2 ** (failures - 1), REFRESH_RETRY_MAX)
+            return UpdateOne(
+                {'_id': user['_id']},
+                {'$set': {
+                    'token_expires_at': now + timedelta(seconds=TOKEN_REFRESH_LEAD + backoff),
+                    'token_refresh_failures': failures
+                }}
+            ), False
+
+        updates = {
+            'token_expires_at': self.token_expiry(new_tokens),
+            'token_updated_at': now
+        }
+        # Google only returns a refresh token when it rotates it
+        if 'refresh_token' in new_tokens:
+            updates['refresh_token'] = self.encrypt_token(new_tokens['refresh_token'])
+        self.logger.debug(f"Refreshed token for user: {user.get('email')}")
+        return UpdateOne(
+            {'_id': user['_id']},
+            {'$set': updates, '$unset': {'token_refresh_failures': ''}}
+        ), True
+
+    def _write_token_updates(self, db, updates: list, fencing_token: int) -> bool:
+        """Write a batch of token updates, returning False if this refresher has been superseded"""
+        # A refresher without the lease, or superseded, must not write stale tokens over its successor's
+        if fencing_token is None:
+            self.logger.warning("Token refresh lease not held, discarding token refreshes")
+            return False
+        if not updates:
+            return True
+        if not claim_fence(db, 'token_refresh', fencing_token):
+            self.logger.warning(f"Fencing token {fencing_token} is stale, discarding token refreshes")
+            return False
+        try:
+            db.users.bulk_write(updates, ordered=False)
+        except Exception as e:
+            self.logger.error(f"Error writing refreshed tokens: {e}")
+        return True
+
+    def seconds_until_next_refresh(self, db) -> float:
+        """Sleep until the earliest tracked token enters the refresh window"""
+        next_user = db.users.find_one(
+            {'refresh_token': {'$exists': True}, 'token_expires_at': {'$ne': None}},
+            {'token_expires_at': 1},
+            sort=[('token_expires_at', 1)]
+        )
+        if next_user is None:
+            return MAX_REFRESH_SLEEP
+        due_in = (next_user['token_expires_at'] - datetime.utcnow()).total_seconds() - TOKEN_REFRESH_LEAD
+        return min(max(due_in, MIN_REFRESH_SLEEP), MAX_REFRESH_SLEEP)
 
     def _refresh_google_token(self, refresh_token: str, client_id: str, client_secret: str) -> dict:
         """Refresh Google OAuth token"""
         try:
-            response = requests.post(
-                'https://oauth2.googleapis.com/token',
+            response = self.http_session.post(
+                GOOGLE_TOKEN_URL,
                 data={
                     'client_id': client_id,
                     'client_secret': client_secret,
                     'refresh_token': refresh_token,
                     'grant_type': 'refresh_token'
-                }
+                },
+                timeout=GOOGLE_REQUEST_TIMEOUT
             )
             
             if response.status_code == 200:
@@ -0,0 +1,62 @@
+import threading
+from logging import Logger
+from typing import Callable
+from pymongo.database import Database
+from pymongo.errors import OperationFailure, PyMongoError
+
+
+class VersionWatcher:
+    """Notify this process when an ingest anywhere commits a new warning version"""
+
+    def __init__(self, db: Database, logger: Logger, on_change: Callable[[], None],
+                 poll_interval: float = 5.0):
+        self.db = db
+        self.logger = logger
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+            self.logger.info("Warning version watcher started")
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.thread = None
+
+    def _run(self) -> None:
+        # Change streams need a replica set; a standalone mongod falls back to polling
+        while not self.stop_event.is_set():
+            try:
+                self._watch_change_stream()
+            except OperationFailure as e:
+                self.logger.info(f"Change streams unavailable ({str(e)}), polling the version document")
+                self._poll()
+                return
+            except PyMongoError as e:
+                self.logger.error(f"Warning version change stream failed: {str(e)}")
+                self.stop_event.wait(self.poll_interval)
+
+    def _watch_change_stream(self) -> None:
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        with self.db.warning_changelog.watch(pipeline, max_await_time_ms=1000) as stream:
+            # Catch up on anything committed before the stream opened
+            self._notify()
+            while not self.stop_event.is_set() and stream.alive:
+                if stream.try_next() is not None:
+                    self._notify()
+
+    def _poll(self) -> None:
+        while not self.stop_event.is_set():
+            self._notify()
+            self.stop_event.wait(self.poll_interval)
+
+    def _notify(self) -> None:
+        try:
+            self.on_change()
+        except Exception as e:
+            self.logger.error(f"Error handling warning version change: {str(e)}")
@@ -0,0 +1,47 @@
+import hashlib
+import json
+import zlib
+from datetime import datetime
+from typing import Dict
+from bson.binary import Binary
+from pymongo import UpdateOne
+
+# Encoding marker stored with each payload so the format can change later
+PAYLOAD_ENCODING = 'zlib+json'
+COMPRESSION_LEVEL = 6
+
+
+def compute_content_hash(warning_feature: Dict) -> str:
+    """Compute a stable hash of a warning feature's content"""
+    canonical = json.dumps(warning_feature, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def compress_payload(warning_feature: Dict) -> Binary:
+    """Serialize and compress a raw warning feature for cold storage"""
+    serialized = json.dumps(warning_feature, separators=(',', ':'), default=str)
+    return Binary(zlib.compress(serialized.encode('utf-8'), COMPRESSION_LEVEL))
+
+
+def decompress_payload(payload: Dict) -> Dict:
+    """Restore a raw warning feature from a warning_payloads document"""
+    if payload.get('encoding') != PAYLOAD_ENCODING:
+        raise ValueError(f"Unsupported payload encoding: {payload.get('encoding')}")
+    return json.loads(zlib.decompress(payload['data']).decode('utf-8'))
+
+
+def payload_upsert(warning_id, content_hash: str, warning_feature: Dict) -> UpdateOne:
+    """Build an idempotent write of a raw payload keyed by warning_id and content hash"""
+    now = datetime.utcnow()
+    return UpdateOne(
+        {'warning_id': warning_id, 'content_hash': content_hash},
+        {
+            '$setOnInsert': {
+                'encoding': PAYLOAD_ENCODING,
+                'data': compress_payload(warning_feature),
+                'created_at': now
+            },
+            '$set': {'last_seen': now}
+        },
+        upsert=True
+    )
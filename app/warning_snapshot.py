@@ -0,0 +1,226 @@
+import threading
+from datetime import datetime
+from logging import Logger
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from spatial_index import BBox, SpatialIndex
+from geometry_simplify import GEOMETRY_FULL, with_geometry_level
+from http_cache import ENCODING_IDENTITY, MIN_COMPRESS_SIZE, compress
+
+# Upper bound on cached serialized bodies per snapshot version
+MAX_SERIALIZED_ENTRIES = 256
+
+# (warning_types, municipalities) a request is filtered by; None means no restriction
+PreferenceKey = Tuple[Optional[Tuple[str, ...]], Optional[Tuple[str, ...]]]
+NO_PREFERENCES = (None, None)
+
+
+class WarningSnapshot:
+    """Process-local, versioned snapshot of the current warnings"""
+
+    def __init__(self, logger: Logger):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.version = 0
+        # Global ingest version and commit time of the data the snapshot holds
+        self.ingest_version = 0
+        self.committed_at = None
+        self.loaded = False
+        self.warnings = {}
+        self.municipality_index = {}
+        self.active_warnings = []
+        self.active_by_id = {}
+        self.spatial_index = SpatialIndex([])
+        self.next_transition = None
+        # The last start or end time the active set changed at, the same in every process
+        self.last_transition = None
+        self.serialized = {}
+
+    def rebuild(self, warnings: List[Dict], ingest_version: int = 0,
+                committed_at: Optional[datetime] = None) -> int:
+        """Replace the snapshot contents with a full set of current warnings"""
+        with self.lock:
+            self.ingest_version = ingest_version
+            self.committed_at = committed_at
+            self.warnings = {}
+            self.municipality_index = {}
+            for warning in warnings:
+                self._add(warning)
+            self.loaded = True
+            self._recompute_active(datetime.utcnow())
+            self.logger.info(f"Warning snapshot rebuilt at version {self.version} with {len(warnings)} warnings")
+            return self.version
+
+    def apply_diff(self, upserted: List[Dict], removed_ids: Iterable, ingest_version: int,
+                   committed_at: datetime) -> int:
+        """Apply the upserts and removals of a committed ingest incrementally"""
+        with self.lock:
+            self.ingest_version = ingest_version
+            self.committed_at = committed_at
+            for warning_id in removed_ids:
+                self._remove(warning_id)
+            for warning in upserted:
+                previous = self._remove(warning['warning_id'])
+                if previous and previous.get('created_at'):
+                    # The database keeps the original created_at on update
+                    warning = dict(warning, created_at=previous['created_at'])
+                self._add(warning)
+            self._recompute_active(datetime.utcnow())
+            self.logger.info(f"Warning snapshot updated to version {self.version} with {len(self.warnings)} warnings")
+            return self.version
+
+    def _add(self, warning: Dict) -> None:
+        """Insert a warning and its municipality postings (caller holds the lock)"""
+        self.warnings[warning['warning_id']] = warning
+        for code in warning.get('municipalities') or []:
+            self.municipality_index.setdefault(str(code), set()).add(warning['warning_id'])
+
+    def _remove(self, warning_id) -> Optional[Dict]:
+        """Remove a warning and its municipality postings (caller holds the lock)"""
+        warning = self.warnings.pop(warning_id, None)
+        if warning:
+            for code in warning.get('municipalities') or []:
+                postings = self.municipality_index.get(str(code))
+                if postings is not None:
+                    postings.discard(warning_id)
+                    if not postings:
+                        del self.municipality_index[str(code)]
+        return warning
+
+    def _recompute_active(self, now: datetime) -> None:
+        """Recompute the active set and bump the version (caller holds the lock)"""
+        self.active_warnings = [
+            warning for warning in self.warnings.values()
+            if warning['start_time'] <= now <= warning['end_time']
+        ]
+        self.active_by_id = {warning['warning_id']: warning for warning in self.active_warnings}
+        self.spatial_index = SpatialIndex(self.active_warnings)
+        # The active set changes again at the next start or end time after now
+        boundaries = [warning['start_time'] for warning in self.warnings.values() if warning['start_time'] > now]
+        boundaries += [warning['end_time'] for warning in self.warnings.values() if warning['end_time'] >= now]
+        self.next_transition = min(boundaries) if boundaries else None
+        passed = [warning['start_time'] for warning in self.warnings.values() if warning['start_time'] <= now]
+        passed += [warning['end_time'] for warning in self.warnings.values() if warning['end_time'] < now]
+        self.last_transition = max(passed) if passed else None
+        self.serialized = {}
+        self.version += 1
+
+    def _refresh_if_due(self) -> None:
+        """Roll the active set forward when a warning started or ended (caller holds the lock)"""
+        now = datetime.utcnow()
+        if self.next_transition is not None and now > self.next_transition:
+            self._recompute_active(now)
+
+    def _municipality_ids(self, municipalities: Tuple[str, ...]) -> Set:
+        """Look up current warning ids for municipality codes (caller holds the lock)"""
+        warning_ids = set()
+        for code in municipalities:
+            warning_ids.update(self.municipality_index.get(str(code), ()))
+        return warning_ids
+
+    @staticmethod
+    def _filter(warnings: List[Dict], warning_types: Optional[Tuple[str, ...]]) -> List[Dict]:
+        if warning_types is None:
+            return list(warnings)
+        return [warning for warning in warnings if warning.get('warning_type') in warning_types]
+
+    def _active_candidates(self, municipalities: Optional[Tuple[str, ...]]) -> List[Dict]:
+        """Active warnings, narrowed through the municipality index if requested (caller holds the lock)"""
+        if municipalities is None:
+            return self.active_warnings
+        warning_ids = self._municipality_ids(municipalities)
+        return [self.active_by_id[warning_id] for warning_id in warning_ids if warning_id in self.active_by_id]
+
+    def get_active(self, preferences: PreferenceKey = NO_PREFERENCES) -> Tuple[int, List[Dict]]:
+        """Return the snapshot version and the active warnings matching the preferences"""
+        with self.lock:
+            self._refresh_if_due()
+            return self.version, self._filter(self._active_candidates(preferences[1]), preferences[0])
+
+    def get_for_municipality(self, code: str,
+                             preferences: PreferenceKey = NO_PREFERENCES) -> Tuple[int, List[Dict]]:
+        """Return the snapshot version and the active warnings for one municipality"""
+        with self.lock:
+            self._refresh_if_due()
+            candidates = self._active_candidates((str(code),))
+            return self.version, self._filter(candidates, preferences[0])
+
+    def get_at_point(self, lon: float, lat: float,
+                     preferences: PreferenceKey = NO_PREFERENCES) -> Tuple[int, List[Dict]]:
+        """Return the snapshot version and the active warnings covering a point"""
+        with self.lock:
+            self._refresh_if_due()
+            return self.version, self._filter(self.spatial_index.query_point(lon, lat), preferences[0])
+
+    def get_in_bbox(self, bbox: BBox,
+                    preferences: PreferenceKey = NO_PREFERENCES) -> Tuple[int, List[Dict]]:
+        """Return the snapshot version and the active warnings intersecting a bounding box"""
+        with self.lock:
+            self._refresh_if_due()
+            return self.version, self._filter(self.spatial_index.query_bbox(bbox), preferences[0])
+
+    def get_delta(self, since_time: datetime, changed_ids: Set, removed_ids: Set,
+                  preferences: PreferenceKey = NO_PREFERENCES) -> Tuple[int, List[Dict], List]:
+        """Return the ingest version, the active warnings to upsert and the ids to remove since a point in time"""
+        with self.lock:
+            self._refresh_if_due()
+            now = datetime.utcnow()
+            # Warnings that started or ended since then changed the active set without an ingest
+            candidates = set(changed_ids)
+            for warning_id, warning in self.warnings.items():
+                if since_time < warning['start_time'] <= now or since_time <= warning['end_time'] < now:
+                    candidates.add(warning_id)
+            
+            warning_types, municipalities = preferences
+            allowed_ids = self._municipality_ids(municipalities) if municipalities is not None else None
+            upserted = []
+            removed = set(removed_ids)
+            for warning_id in candidates:
+                warning = self.active_by_id.get(warning_id)
+                if warning is None \
+                        or (warning_types is not None and warning.get('warning_type') not in warning_types) \
+                        or (allowed_ids is not None and warning_id not in allowed_ids):
+                    removed.add(warning_id)
+                else:
+                    upserted.append(warning)
+            return self.ingest_version, upserted, sorted(removed - {warning['warning_id'] for warning in upserted}, key=str)
+
+    def current_version(self) -> int:
+        """Return the snapshot version, rolling the active set forward first if due"""
+        with self.lock:
+            self._refresh_if_due()
+            return self.version
+
+    def seconds_until_transition(self) -> Optional[float]:
+        """Seconds until the active set next changes without an ingest, or None if it won't"""
+        with self.lock:
+            if self.next_transition is None:
+                return None
+            return (self.next_transition - datetime.utcnow()).total_seconds()
+
+    def current_validator(self) -> Tuple[int, Optional[datetime]]:
+        """Return the ingest version and last active-set transition, which identify the served data in any process"""
+        with self.lock:
+            self._refresh_if_due()
+            return self.ingest_version, self.last_transition
+
+    def get_serialized(self, preferences: PreferenceKey, serializer: Callable[[List[Dict]], str],
+                       geometry_level: str = GEOMETRY_FULL,
+                       encoding: str = ENCODING_IDENTITY) -> Tuple[int, bytes, str]:
+        """Return the ingest version, the pre-serialized JSON body and its content encoding"""
+        with self.lock:
+            self._refresh_if_due()
+            key = (preferences, geometry_level)
+            bodies = self.serialized.get(key)
+            if bodies is None:
+                warnings = self._filter(self._active_candidates(preferences[1]), preferences[0])
+                body = serializer([with_geometry_level(warning, geometry_level) for warning in warnings]).encode('utf-8')
+                if len(self.serialized) >= MAX_SERIALIZED_ENTRIES:
+                    self.serialized = {}
+                bodies = self.serialized[key] = {ENCODING_IDENTITY: body}
+            
+            if len(bodies[ENCODING_IDENTITY]) < MIN_COMPRESS_SIZE:
+                encoding = ENCODING_IDENTITY
+            if encoding not in bodies:
+                # Each encoding is compressed once per snapshot version
+                bodies[encoding] = compress(bodies[ENCODING_IDENTITY], encoding)
+            return self.ingest_version, bodies[encoding], encoding
@@ -0,0 +1,89 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from pymongo import UpdateOne
+
+# Fields statistics can be grouped by, and the longest date range served in one request
+STATS_GROUP_FIELDS = ('day', 'warning_type', 'warning_level', 'municipality')
+STATS_MAX_DAYS = 366
+
+# Longest span of days a single warning is counted towards
+MAX_STATS_SPAN_DAYS = 31
+
+# Warning fields the rollups are computed from
+STATS_FIELDS = ('warning_type', 'warning_level', 'start_time', 'end_time', 'municipalities')
+
+
+def warning_days(warning: Dict) -> Iterator[Tuple[datetime, float]]:
+    """Yield (day, active seconds on that day) for every day a warning is active"""
+    start_time, end_time = warning.get('start_time'), warning.get('end_time')
+    if not start_time or not end_time or end_time < start_time:
+        return
+    first_day = datetime(start_time.year, start_time.month, start_time.day)
+    day = first_day
+    while day == first_day or (day < end_time and day < first_day + timedelta(days=MAX_STATS_SPAN_DAYS)):
+        next_day = day + timedelta(days=1)
+        yield day, (min(end_time, next_day) - max(start_time, day)).total_seconds()
+        day = next_day
+
+
+def add_stats(deltas: Dict, warning: Dict, sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) a warning's contribution to pending rollup increments"""
+    key_fields = (warning.get('warning_type') or 'unknown', warning.get('warning_level') or 'unknown')
+    municipalities = [str(code) for code in warning.get('municipalities') or []]
+    for day, seconds in warning_days(warning):
+        increments = deltas.setdefault((day,) + key_fields, {})
+        fields = ['count', 'active_seconds']
+        fields.extend(f"municipalities.{code}.{field}" for code in municipalities for field in ('count', 'active_seconds'))
+        for field in fields:
+            value = sign if field.endswith('count') else sign * seconds
+            increments[field] = increments.get(field, 0) + value
+
+
+def stats_updates(deltas: Dict) -> List[UpdateOne]:
+    """Build one upsert per rollup document from pending increments, skipping those that cancel out"""
+    operations = []
+    for (day, warning_type, warning_level), increments in deltas.items():
+        increments = {field: value for field, value in increments.items() if value}
+        if increments:
+            operations.append(UpdateOne(
+                {'day': day, 'warning_type': warning_type, 'warning_level': warning_level},
+                {'$inc': increments},
+                upsert=True
+            ))
+    return operations
+
+
+def summarize_stats(docs: Iterable[Dict], group_by: List[str], municipality: Optional[str] = None) -> List[Dict]:
+    """Sum rollup documents into one row per group, sorted by the grouping fields"""
+    groups = {}
+    for doc in docs:
+        if 'municipality' in group_by or municipality:
+            entries = [
+                (code, entry) for code, entry in (doc.get('municipalities') or {}).items()
+                if not municipality or code == municipality
+            ]
+        else:
+            entries = [(None, doc)]
+        for code, entry in entries:
+            values = {
+                'day': doc['day'].date().isoformat(),
+                'warning_type': doc['warning_type'],
+                'warning_level': doc['warning_level'],
+                'municipality': code
+            }
+            key = tuple(values[field] for field in group_by)
+            group = groups.setdefault(key, {'count': 0, 'active_seconds': 0})
+            group['count'] += entry.get('count', 0)
+            group['active_seconds'] += entry.get('active_seconds', 0)
+
+    return [
+        dict(zip(group_by, key), count=group['count'], active_seconds=round(group['active_seconds']))
+        for key, group in sorted(groups.items(), key=lambda item: tuple(str(value) for value in item[0]))
+        if group['count'] > 0
+    ]
+
+
+def parse_day(value: str) -> datetime:
+    """Parse a YYYY-MM-DD date into the datetime rollups are keyed by, raising ValueError if malformed"""
+    day = date.fromisoformat(value)
+    return datetime(day.year, day.month, day.day)
@@ -0,0 +1,58 @@
+import hashlib
+import tempfile
+from typing import Any, Iterator
+import ijson
+import requests
+
+# Response bodies up to this size stay in memory; larger ones spill to a temporary file
+SPOOL_MEMORY_LIMIT = 8 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class WarningsBody:
+    """A spooled getWarnstatus response body whose features are parsed one at a time"""
+
+    def __init__(self, file, digest: str, size: int):
+        self.file = file
+        self.digest = digest
+        self.size = size
+
+    def iter_features(self) -> Iterator[Any]:
+        """Yield each item of the top-level 'features' array without building the whole document
+
+        Items are yielded whatever their type, so callers can reject ones that are not features.
+        """
+        self.file.seek(0)
+        found = False
+        builder = None
+        for prefix, event, value in ijson.parse(self.file, use_float=True):
+            if prefix == 'features' and event == 'start_array':
+                found = True
+            elif prefix == 'features.item' and builder is None:
+                if event not in ('start_map', 'start_array'):
+                    yield value
+                    continue
+                builder = ijson.ObjectBuilder()
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == 'features.item' and event in ('end_map', 'end_array'):
+                    yield builder.value
+                    builder = None
+        # Checked at the end, so a body without features fails before anything is written
+        if not found:
+            raise ValueError("'features' array missing in warnings response")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def spool_response(response: requests.Response) -> WarningsBody:
+    """Read a streamed response body incrementally, hashing it as it arrives"""
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+    for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+        spool.write(chunk)
+    return WarningsBody(spool, digest.hexdigest(), size)
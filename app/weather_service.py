@@ -1,18 +1,99 @@
+import logging
 import requests
+import os
 from datetime import datetime, timedelta
-import json
-from typing import Dict, List, Optional
+import time
+import base64
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from logging_config import setup_logger
+from metrics import outbound_hook, INGEST_PAYLOAD_BYTES, INGEST_WARNINGS
+from warning_stream import WarningsBody, spool_response
+from warning_snapshot import WarningSnapshot, PreferenceKey, NO_PREFERENCES
+from warning_payloads import compute_content_hash, decompress_payload, payload_upsert
+from warning_stats import STATS_FIELDS, add_stats, stats_updates, summarize_stats
+from geometry_simplify import GEOMETRY_FULL, build_geometry_levels, with_geometry_level
+from http_cache import ENCODING_IDENTITY, make_etag
+from job_lease import claim_fence
+from invalidation_log import InvalidationLog
 from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo import UpdateOne, UpdateMany, ReturnDocument
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
 from urllib3.util import Retry
 from requests.adapters import HTTPAdapter
 
+# Overridable so load tests can ingest from a local stand-in
+ZAMG_API_URL = os.environ.get('ZAMG_API_URL', 'https://warnungen.zamg.at/wsapp/api/getWarnstatus')
+
+# Outcomes of a fetch_warnings call
+FETCH_UPDATED = 'updated'
+FETCH_UNCHANGED = 'unchanged'
+FETCH_FAILED = 'failed'
+
+# How long cached user preferences are trusted before re-reading them, and how many are kept
+PREFERENCES_CACHE_TTL = 60
+PREFERENCES_CACHE_SIZE = 10000
+
+# Warning fields tracked per revision in warning_history, and the revisions kept per warning
+HISTORY_FIELDS = ('warning_type', 'warning_level', 'start_time', 'end_time', 'geometry', 'municipalities')
+MAX_HISTORY_REVISIONS = 100
+
+# Retention of warning_history and of the statistics rollups (both enforced by TTL indexes)
+HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', 30))
+STATS_RETENTION_DAYS = int(os.environ.get('STATS_RETENTION_DAYS', 365))
+# How often the payloads of current warnings are marked as seen, so they outlive the retention
+PAYLOAD_TOUCH_INTERVAL = 86400
+
+# Server-side page size cap and cursor batch size for historical warnings
+HISTORICAL_PAGE_LIMIT = 500
+HISTORICAL_STREAM_BATCH_SIZE = 200
+
+# Changed warnings processed and written per bulk write while streaming an ingest
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 100))
+
+# How long ingest changelog entries are kept for delta sync before clients must resync
+CHANGELOG_RETENTION_DAYS = 1
+
+
+def encode_cursor(created_at: datetime, object_id: ObjectId) -> str:
+    """Encode a (created_at, _id) keyset position as an opaque cursor"""
+    position = f"{created_at.isoformat()}|{object_id}"
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        created_at, object_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), ObjectId(object_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def historical_window_start(days: int) -> datetime:
+    """Start of the history window, aligned to midnight UTC so it only moves once a day"""
+    start = datetime.utcnow() - timedelta(days=days)
+    return datetime(start.year, start.month, start.day)
+
 class WeatherService:
     def __init__(self, db: Database):
-        self.api_url = 'https://warnungen.zamg.at/wsapp/api/getWarnstatus'
+        self.api_url = ZAMG_API_URL
         self.db = db
+        self.fetch_validators = {}
+        self.pending_validators = None
         self.logger = setup_logger('weather_service', 'weather_service.log')
+        self.snapshot = WarningSnapshot(self.logger)
+        # user_id -> (preferences, cached_at), least recently used first
+        self.preferences_cache = OrderedDict()
+        self.preferences_lock = threading.Lock()
+        # Bumped on every invalidation, so a lookup overtaken by a change is not cached
+        self.preferences_generation = 0
+        self.preference_changes = InvalidationLog(db.preference_changes, self.logger)
+        self.payloads_touched_at = None
+        self.stats_ready = False
         self.setup_db_indexes()
         self.setup_requests_session()
         self.logger.info(f"WeatherService initialized with API URL: {self.api_url}")
@@ -31,61 +112,101 @@ class WeatherService:
         
         adapter = HTTPAdapter(max_retries=retry_strategy)
         self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.hooks['response'].append(outbound_hook('zamg')['response'])
         self.logger.info("Requests session configured with retry strategy")
 
-    def fetch_warnings(self) -> Optional[Dict]:
-        """Fetch warnings from ZAMG API"""
+    def setup_ttl_index(self, collection: Collection, field: str, retention_days: int) -> None:
+        """Create or retune a TTL index so documents expire retention_days after field"""
+        expire_after = retention_days * 86400
+        index_name = f"{field}_1"
+        existing = collection.index_information().get(index_name)
+        
+        if existing and existing.get('expireAfterSeconds') is not None:
+            if existing['expireAfterSeconds'] != expire_after:
+                self.db.command('collMod', collection.name, index={
+                    'keyPattern': {field: 1},
+                    'expireAfterSeconds': expire_after
+                })
+                self.logger.info(f"Changed retention of {collection.name} to {retention_days} days")
+            return
+        
+        if existing:
+            # A plain index on the same key would conflict with the TTL options
+            collection.drop_index(index_name)
+        collection.create_index([(field, 1)], expireAfterSeconds=expire_after)
+        self.logger.info(f"Created TTL index on {collection.name}.{field} ({retention_days} days)")
+
+    def fetch_warnings(self) -> Tuple[str, Optional[Union[Dict, WarningsBody]]]:
+        """Fetch warnings from ZAMG API, returning a (status, warnings) tuple
+
+        Updated warnings come back as a spooled WarningsBody whose features
+        save_warnings parses one at a time; the caller closes it.
+        """
         try:
             self.logger.info(f"Starting API call to: {self.api_url}")
             
-            # Use session for requests with retry logic
-            response = self.session.get(
-                self.api_url,
-                headers={
-                    'accept': 'application/json',
-                    'user-agent': 'Mozilla/5.0'
-                },
-                timeout=30
-            )
-            
-            # Detailed logging of the response
-            self.logger.info(f"API Response Status Code: {response.status_code}")
-            self.logger.info(f"API Response Headers: {dict(response.headers)}")
-            
-            # Log first part of response content for debugging
-            self.logger.debug(f"API Response Content (first 500 chars): {response.text[:500]}")
+            headers = {
+                'accept': 'application/json',
+                'user-agent': 'Mozilla/5.0'
+            }
+            # Send validators from the last successfully ingested response
+            if self.fetch_validators.get('etag'):
+                headers['If-None-Match'] = self.fetch_validators['etag']
+            if self.fetch_validators.get('last_modified'):
+                headers['If-Modified-Since'] = self.fetch_validators['last_modified']
             
-            if response.status_code == 204:
-                self.logger.info("No content returned from API (Status 204)")
-                return {'features': []}
+            # Stream the body so it is never held in memory as one string
+            with self.session.get(self.api_url, headers=headers, timeout=30, stream=True) as response:
+                self.logger.info("API response status code: %s", response.status_code)
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("API response headers: %s", dict(response.headers))
+                
+                if response.status_code == 304:
+                    self.logger.info("Warnings not modified since last fetch (Status 304)")
+                    return FETCH_UNCHANGED, None
                 
-            response.raise_for_status()
+                if response.status_code == 204:
+                    self.logger.info("No content returned from API (Status 204)")
+                    self.pending_validators = {}
+                    return FETCH_UPDATED, {'features': []}
+                    
+                response.raise_for_status()
+                body = spool_response(response)
             
-            try:
-                warnings = response.json()
-                if self.validate_warnings_format(warnings):
-                    self.logger.info(f"Successfully fetched {len(warnings.get('features', []))} warnings")
-                    return warnings
-                else:
-                    self.logger.error("Invalid warnings format received")
-                    self.logger.debug(f"Invalid response content: {response.text}")
-                    return None
-            except json.JSONDecodeError as e:
-                self.logger.error(f"JSON decode error: {str(e)}\nResponse content: {response.text[:500]}")
-                return None
+            INGEST_PAYLOAD_BYTES.set(value=body.size)
+            # Fall back to a digest of the raw body when no validators are provided
+            if body.digest == self.fetch_validators.get('digest'):
+                self.logger.info("Warnings payload unchanged since last fetch (same digest)")
+                body.close()
+                return FETCH_UNCHANGED, None
+            
+            self.logger.info(f"Fetched {body.size} bytes of warnings")
+            self.pending_validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'digest': body.digest
+            }
+            return FETCH_UPDATED, body
                 
         except requests.ConnectionError as e:
             self.logger.error(f"Connection error while fetching warnings: {str(e)}")
-            return None
+            return FETCH_FAILED, None
         except requests.Timeout as e:
             self.logger.error(f"Timeout while fetching warnings: {str(e)}")
-            return None
+            return FETCH_FAILED, None
         except requests.RequestException as e:
             self.logger.error(f"Error fetching warnings: {str(e)}")
-            return None
+            return FETCH_FAILED, None
         except Exception as e:
             self.logger.error(f"Unexpected error in fetch_warnings: {str(e)}", exc_info=True)
-            return None
+            return FETCH_FAILED, None
+
+    def commit_fetch_validators(self) -> None:
+        """Remember the validators of the last fetched payload once it has been saved"""
+        if self.pending_validators is not None:
+            self.fetch_validators = self.pending_validators
+            self.pending_validators = None
 
     def validate_warnings_format(self, warnings: Dict) -> bool:
         """Validate the format of the warnings response"""
@@ -116,11 +237,32 @@ class WeatherService:
             self.db.current_warnings.create_index([("start_time", 1), ("end_time", 1)])
             self.db.current_warnings.create_index([("warning_type", 1)])
             self.db.current_warnings.create_index([("warning_level", 1)])
+            self.db.current_warnings.create_index([("municipalities", 1)])
             
-            # Historical warnings indexes
-            self.db.historical_warnings.create_index([("created_at", 1)])
-            self.db.historical_warnings.create_index("warning_id")
-            self.db.historical_warnings.create_index([("warning_type", 1)])
+            # Warning history indexes
+            self.db.warning_history.create_index("warning_id", unique=True)
+            self.db.warning_history.create_index([("created_at", -1), ("_id", -1)])
+            self.db.warning_history.create_index([("warning_type", 1)])
+            self.setup_ttl_index(self.db.warning_history, 'updated_at', HISTORY_RETENTION_DAYS)
+            
+            # Statistics rollup indexes
+            self.db.warning_stats.create_index([("day", 1), ("warning_type", 1), ("warning_level", 1)], unique=True)
+            self.setup_ttl_index(self.db.warning_stats, 'day', STATS_RETENTION_DAYS)
+            
+            # Raw payload indexes
+            self.db.warning_payloads.create_index([("warning_id", 1), ("content_hash", 1)], unique=True)
+            if 'created_at_1' in self.db.warning_payloads.index_information():
+                # Payloads used to expire by creation time, even while their warning was still current
+                self.db.warning_payloads.update_many(
+                    {'last_seen': {'$exists': False}},
+                    [{'$set': {'last_seen': '$created_at'}}]
+                )
+                self.db.warning_payloads.drop_index('created_at_1')
+            self.setup_ttl_index(self.db.warning_payloads, 'last_seen', HISTORY_RETENTION_DAYS)
+            
+            # Ingest changelog indexes
+            self.db.warning_changelog.create_index("version", unique=True)
+            self.setup_ttl_index(self.db.warning_changelog, 'committed_at', CHANGELOG_RETENTION_DAYS)
             
             # User preferences indexes
             self.db.user_preferences.create_index("user_id", unique=True)
@@ -130,27 +272,6 @@ class WeatherService:
             self.logger.error(f"Error creating database indexes: {str(e)}")
             raise
 
-    def fetch_warnings(self) -> Optional[Dict]:
-        """Fetch warnings from ZAMG API"""
-        try:
-            self.logger.info("Fetching warnings from ZAMG API")
-            response = requests.get(
-                self.api_url,
-                headers={'accept': 'application/json'},
-                timeout=10
-            )
-            response.raise_for_status()
-            
-            warnings = response.json()
-            self.logger.info(f"Successfully fetched {len(warnings.get('features', []))} warnings")
-            return warnings
-        except requests.RequestException as e:
-            self.logger.error(f"Error fetching warnings: {str(e)}")
-            return None
-        except json.JSONDecodeError as e:
-            self.logger.error(f"Error decoding JSON response: {str(e)}")
-            return None
-
     def process_warning(self, warning_feature: Dict) -> Optional[Dict]:
         """Process a single warning feature from the API response"""
         try:
@@ -184,8 +305,10 @@ class WeatherService:
                 'start_time': start_time,
                 'end_time': end_time,
                 'geometry': warning_feature.get('geometry'),
+                'geometry_levels': build_geometry_levels(warning_feature.get('geometry')),
                 'municipalities': properties.get('gemeinden', []),
                 'raw_data': warning_feature,
+                'content_hash': compute_content_hash(warning_feature),
                 'created_at': datetime.utcnow(),
                 'updated_at': datetime.utcnow()
             }
@@ -193,107 +316,647 @@ class WeatherService:
             self.logger.error(f"Error processing warning: {str(e)}")
             return None
 
-    def save_warnings(self, warnings_data: Dict) -> bool:
-        """Save warnings to database and archive old warnings"""
-        if not warnings_data or 'features' not in warnings_data:
+    def save_warnings(self, warnings_data: Union[Dict, WarningsBody], fencing_token: Optional[int]) -> bool:
+        """Apply the fetched warnings as an incremental diff against current warnings
+
+        Features are streamed twice: once to diff ids and content hashes against
+        current warnings, then again to process and write only the changed ones in
+        batches, so memory stays bounded by the batch size rather than the payload.
+        Nothing is written without the ingest lease's fencing token; None means
+        the lease was lost.
+        """
+        if isinstance(warnings_data, WarningsBody):
+            iter_features = warnings_data.iter_features
+        elif warnings_data and self.validate_warnings_format(warnings_data):
+            iter_features = lambda: iter(warnings_data['features'])
+        else:
             self.logger.warning("No valid warnings data to save")
             return False
         
         try:
             current_time = datetime.utcnow()
             
-            # Process new warnings
-            processed_warnings = []
-            for feature in warnings_data['features']:
-                processed_warning = self.process_warning(feature)
-                if processed_warning:
-                    processed_warnings.append(processed_warning)
-            
-            if processed_warnings:
-                # Archive existing warnings
-                existing_warnings = list(self.db.current_warnings.find({}))
-                if existing_warnings:
-                    self.db.historical_warnings.insert_many(existing_warnings)
-                    self.logger.info(f"Archived {len(existing_warnings)} warnings")
-                
-                # Update current warnings
-                self.db.current_warnings.delete_many({})  # Clear current warnings
-                self.db.current_warnings.insert_many(processed_warnings)
-                self.logger.info(f"Saved {len(processed_warnings)} new warnings")
-                
-                # Clean up old historical data
-                cleanup_date = current_time - timedelta(days=30)
-                result = self.db.historical_warnings.delete_many({
-                    'created_at': {'$lt': cleanup_date}
-                })
-                self.logger.info(f"Cleaned up {result.deleted_count} old historical warnings")
-                
+            # First pass: identify fetched warnings by id and content hash without processing them
+            fetched_hashes = {}
+            feature_count = 0
+            for feature in iter_features():
+                feature_count += 1
+                properties = feature.get('properties') if isinstance(feature, dict) else None
+                warning_id = properties.get('warnid') if isinstance(properties, dict) else None
+                # A malformed item must not read as an empty feed, which would expire every warning
+                if not warning_id:
+                    self.logger.error(f"Fetched feature {feature_count} is not a warning with an id")
+                    return False
+                fetched_hashes[warning_id] = compute_content_hash(feature)
+            INGEST_WARNINGS.set(value=feature_count)
+            
+            # Diff against current state by warning_id and content hash
+            existing_hashes = {
+                doc['warning_id']: doc.get('content_hash')
+                for doc in self.db.current_warnings.find({}, {'_id': 0, 'warning_id': 1, 'content_hash': 1})
+            }
+            
+            upserted_ids = {
+                warning_id for warning_id, content_hash in fetched_hashes.items()
+                if existing_hashes.get(warning_id) != content_hash
+            }
+            expired_ids = [warning_id for warning_id in existing_hashes if warning_id not in fetched_hashes]
+            
+            if not upserted_ids and not expired_ids:
+                self.logger.info(f"No changes in {len(fetched_hashes)} warnings, nothing to write")
+                self.touch_current_payloads(fetched_hashes, current_time)
+                self.commit_fetch_validators()
                 return True
+            
+            # A superseded ingest leader must not write over its successor
+            if fencing_token is None:
+                self.logger.warning("Ingest lease not held, discarding ingest")
+                return False
+            if not claim_fence(self.db, 'warning_ingest', fencing_token):
+                self.logger.warning(f"Fencing token {fencing_token} is stale, discarding ingest")
+                return False
         except Exception as e:
             self.logger.error(f"Error saving warnings to database: {str(e)}")
             return False
         
-        return False
+        # Second pass: process and write changed warnings batch by batch
+        written = []
+        views = []
+        removed = []
+        rejected_ids = set()
+        try:
+            batch = {}
+            for feature in iter_features():
+                warning_id = (feature.get('properties') or {}).get('warnid')
+                if warning_id not in upserted_ids:
+                    continue
+                processed_warning = self.process_warning(feature)
+                # With duplicate ids only the copy seen in the first pass is written
+                if not processed_warning:
+                    if compute_content_hash(feature) == fetched_hashes[warning_id]:
+                        rejected_ids.add(warning_id)
+                    continue
+                if processed_warning['content_hash'] != fetched_hashes[warning_id]:
+                    continue
+                batch[warning_id] = processed_warning
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    self.write_warning_batch(batch, existing_hashes, current_time)
+                    written.extend(batch)
+                    views.extend(self._snapshot_view(warning) for warning in batch.values())
+                    batch = {}
+            if batch:
+                self.write_warning_batch(batch, existing_hashes, current_time)
+                written.extend(batch)
+                views.extend(self._snapshot_view(warning) for warning in batch.values())
+            
+            if rejected_ids and rejected_ids == set(fetched_hashes):
+                self.logger.error("None of the fetched warnings could be processed")
+                return False
+            # A warning that can no longer be processed is treated as gone, as if the feed had dropped it
+            expired_ids += [warning_id for warning_id in rejected_ids if warning_id in existing_hashes]
+            
+            if expired_ids:
+                expired_states = list(self.db.current_warnings.find(
+                    {'warning_id': {'$in': expired_ids}},
+                    {'_id': 0, **{field: 1 for field in STATS_FIELDS}}
+                ))
+                # Warnings withdrawn before their end time stop counting as active when they expire
+                withdrawn_states = [
+                    dict(warning, end_time=min(warning['end_time'], current_time)) for warning in expired_states
+                ]
+                self.record_history({}, [], [], expired_ids, current_time)
+                self.update_stats(withdrawn_states, expired_states)
+                try:
+                    self.db.current_warnings.delete_many({'warning_id': {'$in': expired_ids}})
+                except Exception:
+                    self.update_stats(expired_states, withdrawn_states)
+                    raise
+                removed = expired_ids
+            
+            changed_count = sum(1 for warning_id in written if warning_id in existing_hashes)
+            self.logger.info(
+                f"Applied warning diff: {len(written) - changed_count} new, "
+                f"{changed_count} updated, {len(removed)} expired"
+            )
+            self.commit_ingest(written, existing_hashes, removed, views, current_time)
+            self.touch_current_payloads(
+                {warning_id: content_hash for warning_id, content_hash in fetched_hashes.items()
+                 if warning_id not in rejected_ids},
+                current_time
+            )
+            self.commit_fetch_validators()
+            return True
+        except Exception as e:
+            self.logger.error(f"Error saving warnings to database: {str(e)}")
+            # Publish whatever batches did land, so readers and delta sync stay consistent with the DB
+            if written or removed:
+                try:
+                    self.commit_ingest(written, existing_hashes, removed, views, current_time)
+                except Exception as commit_error:
+                    self.logger.error(f"Error recording partial ingest: {str(commit_error)}")
+            return False
 
-    def get_active_warnings(self, user_id: Optional[str] = None) -> List[Dict]:
-        """Get active warnings, optionally filtered by user preferences"""
+    def write_warning_batch(self, batch: Dict, existing_hashes: Dict, current_time: datetime) -> None:
+        """Write one batch of processed warnings to history, payloads and current warnings"""
+        batch_ids = list(batch)
+        changed_ids = [warning_id for warning_id in batch_ids if warning_id in existing_hashes]
+        previous_states = self.load_previous_states(changed_ids)
+        # Warnings that expired earlier and are back still count with their expired state
+        reissued_states = self.db.warning_history.find(
+            {'warning_id': {'$in': [warning_id for warning_id in batch_ids if warning_id not in existing_hashes]},
+             'expired_at': {'$exists': True}},
+            {'_id': 0, 'warning_id': 1, 'expired_at': 1, **{field: 1 for field in STATS_FIELDS}}
+        )
+        counted_states = dict(previous_states)
+        counted_states.update(
+            (warning['warning_id'], dict(warning, end_time=min(warning['end_time'], warning['expired_at'])))
+            for warning in reissued_states
+        )
+        
+        # Record revisions only for warnings that are new or changed
+        self.record_history(batch, batch_ids, changed_ids, [], current_time, previous_states)
+        
+        # Keep raw payloads compressed in a cold collection, one per content hash
+        self.db.warning_payloads.bulk_write([
+            payload_upsert(warning_id, warning['content_hash'], warning['raw_data'])
+            for warning_id, warning in batch.items()
+        ], ordered=False)
+        
+        operations = []
+        for warning_id, processed_warning in batch.items():
+            warning = dict(processed_warning)
+            created_at = warning.pop('created_at')
+            del warning['raw_data']
+            operations.append(UpdateOne(
+                {'warning_id': warning_id},
+                {'$set': warning, '$setOnInsert': {'created_at': created_at}, '$unset': {'raw_data': ""}},
+                upsert=True
+            ))
+        
+        # Rollups move before current warnings do: a change whose write fails is still a change
+        # to the next ingest, which applies it again, so the rollups must not already hold it
+        self.update_stats(batch.values(), counted_states.values())
         try:
-            current_time = datetime.utcnow()
-            query = {
-                'start_time': {'$lte': current_time},
-                'end_time': {'$gte': current_time}
+            self.db.current_warnings.bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Back out the rollups of the warnings left unwritten
+            failed_ids = batch_ids
+            if isinstance(e, BulkWriteError):
+                failed_ids = [batch_ids[error['index']] for error in e.details.get('writeErrors', [])]
+            self.update_stats(
+                [counted_states[warning_id] for warning_id in failed_ids if warning_id in counted_states],
+                [batch[warning_id] for warning_id in failed_ids]
+            )
+            raise
+
+    def touch_current_payloads(self, current_hashes: Dict, current_time: datetime) -> None:
+        """Mark the payloads of current warnings as seen, at most once per touch interval"""
+        if self.payloads_touched_at and current_time - self.payloads_touched_at < timedelta(seconds=PAYLOAD_TOUCH_INTERVAL):
+            return
+        try:
+            if current_hashes:
+                self.db.warning_payloads.update_many(
+                    {'$or': [
+                        {'warning_id': warning_id, 'content_hash': content_hash}
+                        for warning_id, content_hash in current_hashes.items()
+                    ]},
+                    {'$set': {'last_seen': current_time}}
+                )
+            self.payloads_touched_at = current_time
+        except Exception as e:
+            self.logger.error(f"Error refreshing current warning payloads: {str(e)}")
+
+    def commit_ingest(self, written: List, existing_hashes: Dict, removed: List, views: List[Dict],
+                      current_time: datetime) -> int:
+        """Record a new ingest version and what it changed, then apply it to the snapshot"""
+        ingest_version = self.db.counters.find_one_and_update(
+            {'_id': 'warning_version'},
+            {'$inc': {'seq': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )['seq']
+        self.db.warning_changelog.insert_one({
+            'version': ingest_version,
+            'added': [warning_id for warning_id in written if warning_id not in existing_hashes],
+            'updated': [warning_id for warning_id in written if warning_id in existing_hashes],
+            'removed': removed,
+            'committed_at': current_time
+        })
+        
+        if self.snapshot.loaded:
+            self.snapshot.apply_diff(views, removed, ingest_version, current_time)
+        else:
+            self.refresh_snapshot()
+        return ingest_version
+
+    def load_previous_states(self, changed_ids: List) -> Dict:
+        """Load the stored state of changed warnings before they are overwritten"""
+        if not changed_ids:
+            return {}
+        return {
+            doc['warning_id']: doc
+            for doc in self.db.current_warnings.find(
+                {'warning_id': {'$in': changed_ids}},
+                {'_id': 0, 'warning_id': 1, 'content_hash': 1, **{field: 1 for field in HISTORY_FIELDS}}
+            )
+        }
+
+    def record_history(self, processed_warnings: Dict, upserted_ids: List, changed_ids: List,
+                       expired_ids: List, current_time: datetime, previous_states: Optional[Dict] = None) -> None:
+        """Record new, changed and expired warnings as compact revisions in warning_history"""
+        if previous_states is None:
+            previous_states = self.load_previous_states(changed_ids)
+        
+        operations = []
+        for warning_id in upserted_ids:
+            warning = processed_warnings[warning_id]
+            update = {
+                '$set': {
+                    **{field: warning.get(field) for field in HISTORY_FIELDS},
+                    'content_hash': warning['content_hash'],
+                    'updated_at': current_time
+                },
+                '$setOnInsert': {'created_at': current_time},
+                '$unset': {'expired_at': ""}
             }
+            previous = previous_states.get(warning_id)
+            if previous:
+                # Keep only the previous values of fields that actually changed
+                changes = {
+                    field: previous.get(field) for field in HISTORY_FIELDS
+                    if previous.get(field) != warning.get(field)
+                }
+                update['$push'] = {'revisions': {
+                    '$each': [{
+                        'recorded_at': current_time,
+                        'content_hash': previous.get('content_hash'),
+                        'previous': changes
+                    }],
+                    '$slice': -MAX_HISTORY_REVISIONS
+                }}
+            operations.append(UpdateOne({'warning_id': warning_id}, update, upsert=True))
+        
+        if expired_ids:
+            operations.append(UpdateMany(
+                {'warning_id': {'$in': expired_ids}},
+                {'$set': {'expired_at': current_time, 'updated_at': current_time}}
+            ))
+        
+        if operations:
+            self.db.warning_history.bulk_write(operations, ordered=False)
+            self.logger.info(
+                f"Recorded history: {len(upserted_ids) - len(changed_ids)} new, "
+                f"{len(changed_ids)} revised, {len(expired_ids)} expired"
+            )
+
+    def get_daily_summaries(self, days: int = 90) -> List[Dict]:
+        """Get warning counts per day by type and level, newest first, read from the statistics rollups"""
+        today = datetime.utcnow()
+        end_day = datetime(today.year, today.month, today.day)
+        rows = self.get_warning_stats(end_day - timedelta(days=days - 1), end_day,
+                                      ['day', 'warning_type', 'warning_level'])
+        summaries = {}
+        for row in rows:
+            summary = summaries.setdefault(row['day'], {'day': row['day'], 'counts': {}, 'total': 0})
+            summary['counts'].setdefault(row['warning_type'], {})[row['warning_level']] = row['count']
+            summary['total'] += row['count']
+        return sorted(summaries.values(), key=lambda summary: summary['day'], reverse=True)
+
+    def update_stats(self, added: Iterable[Dict], removed: Iterable[Dict]) -> None:
+        """Move warnings' contributions in the statistics rollups from their removed to their added states"""
+        deltas = {}
+        for warning in removed:
+            add_stats(deltas, warning, -1)
+        for warning in added:
+            add_stats(deltas, warning, 1)
+        operations = stats_updates(deltas)
+        if operations:
+            self.db.warning_stats.bulk_write(operations, ordered=False)
+
+    def rebuild_stats(self) -> int:
+        """Recompute the statistics rollups from warning_history, returning the warnings counted"""
+        warnings = self.db.warning_history.find(
+            {},
+            {'_id': 0, 'expired_at': 1, **{field: 1 for field in STATS_FIELDS}},
+            batch_size=HISTORICAL_STREAM_BATCH_SIZE
+        )
+        deltas = {}
+        count = 0
+        for warning in warnings:
+            if warning.get('expired_at') and warning.get('end_time'):
+                warning['end_time'] = min(warning['end_time'], warning['expired_at'])
+            add_stats(deltas, warning, 1)
+            count += 1
+        
+        self.db.warning_stats.delete_many({})
+        operations = stats_updates(deltas)
+        if operations:
+            self.db.warning_stats.bulk_write(operations, ordered=False)
+        self.db.counters.update_one({'_id': 'warning_stats'}, {'$set': {'rebuilt_at': datetime.utcnow()}}, upsert=True)
+        self.logger.info(f"Rebuilt warning statistics from {count} warnings into {len(operations)} rollups")
+        return count
+
+    def ensure_stats(self) -> None:
+        """Build the statistics rollups once, before the first ingest that maintains them"""
+        if self.stats_ready:
+            return
+        try:
+            if not self.db.counters.find_one({'_id': 'warning_stats'}):
+                self.rebuild_stats()
+            self.stats_ready = True
+        except Exception as e:
+            self.logger.error(f"Error building warning statistics: {str(e)}")
+
+    def get_warning_stats(self, start_day: datetime, end_day: datetime, group_by: List[str],
+                          warning_type: Optional[str] = None, warning_level: Optional[str] = None,
+                          municipality: Optional[str] = None) -> List[Dict]:
+        """Get warning counts and active time per group between two days, read from the rollups only"""
+        try:
+            query = {'day': {'$gte': start_day, '$lte': end_day}}
+            if warning_type:
+                query['warning_type'] = warning_type
+            if warning_level:
+                query['warning_level'] = warning_level
             
-            # Apply user preferences if user_id is provided
-            if user_id:
-                user_prefs = self.db.user_preferences.find_one({'user_id': user_id})
-                if user_prefs and 'warning_types' in user_prefs:
-                    query['warning_type'] = {'$in': user_prefs['warning_types']}
+            # Per-municipality figures are only read when they are asked for
+            if municipality:
+                projection = {'_id': 0, 'day': 1, 'warning_type': 1, 'warning_level': 1,
+                              f"municipalities.{municipality}": 1}
+            elif 'municipality' in group_by:
+                projection = {'_id': 0}
+            else:
+                projection = {'_id': 0, 'municipalities': 0}
             
-            warnings = list(self.db.current_warnings.find(
-                query,
-                {'_id': 0, 'raw_data': 0}
-            ))
-            self.logger.info(f"Found {len(warnings)} active warnings")
-            return warnings
+            return summarize_stats(self.db.warning_stats.find(query, projection), group_by, municipality)
+        except Exception as e:
+            self.logger.error(f"Error fetching warning statistics: {str(e)}")
+            return []
+
+    @staticmethod
+    def _snapshot_view(warning: Dict) -> Dict:
+        """Strip a processed warning down to the fields served from the snapshot"""
+        return {key: value for key, value in warning.items() if key not in ('_id', 'raw_data')}
+
+    def refresh_snapshot(self) -> int:
+        """Reload the in-memory snapshot of current warnings from the database"""
+        latest = self.db.warning_changelog.find_one({}, {'_id': 0, 'version': 1, 'committed_at': 1},
+                                                    sort=[('version', -1)])
+        warnings = list(self.db.current_warnings.find({}, {'_id': 0, 'raw_data': 0}))
+        if latest:
+            return self.snapshot.rebuild(warnings, latest['version'], latest['committed_at'])
+        return self.snapshot.rebuild(warnings)
+
+    def sync_snapshot(self) -> bool:
+        """Reload the snapshot if another process committed a newer ingest version"""
+        try:
+            latest = self.db.counters.find_one({'_id': 'warning_version'})
+            if latest and latest['seq'] != self.snapshot.ingest_version:
+                self.refresh_snapshot()
+                return True
+        except Exception as e:
+            self.logger.error(f"Error syncing warning snapshot: {str(e)}")
+        return False
+
+    def ensure_snapshot(self) -> None:
+        """Load the snapshot on first use if no ingest has populated it yet"""
+        if not self.snapshot.loaded:
+            self.refresh_snapshot()
+
+    def get_user_preferences_key(self, user_id: Optional[str]) -> PreferenceKey:
+        """Get the user's (warning_types, municipalities) filter as a hashable key"""
+        if not user_id:
+            return NO_PREFERENCES
+        
+        self._poll_preference_changes()
+        with self.preferences_lock:
+            cached = self.preferences_cache.get(user_id)
+            if cached and time.monotonic() - cached[1] < PREFERENCES_CACHE_TTL:
+                self.preferences_cache.move_to_end(user_id)
+                return cached[0]
+            lookup_generation = self.preferences_generation
+        
+        user_prefs = self.db.user_preferences.find_one({'user_id': user_id}) or {}
+        warning_types = None
+        if 'warning_types' in user_prefs:
+            warning_types = tuple(sorted(user_prefs['warning_types']))
+        municipalities = None
+        if user_prefs.get('municipalities'):
+            municipalities = tuple(sorted(str(code) for code in user_prefs['municipalities']))
+        preferences = (warning_types, municipalities)
+        with self.preferences_lock:
+            if self.preferences_generation == lookup_generation:
+                self.preferences_cache[user_id] = (preferences, time.monotonic())
+                self.preferences_cache.move_to_end(user_id)
+                while len(self.preferences_cache) > PREFERENCES_CACHE_SIZE:
+                    self.preferences_cache.popitem(last=False)
+        return preferences
+
+    def invalidate_preferences(self, user_id: Optional[str] = None) -> None:
+        """Drop a user's cached preferences in this process, or all of them"""
+        with self.preferences_lock:
+            self.preferences_generation += 1
+            if user_id is None:
+                self.preferences_cache.clear()
+            else:
+                self.preferences_cache.pop(user_id, None)
+
+    def _poll_preference_changes(self) -> None:
+        """Apply preference changes made through other processes"""
+        try:
+            for user_id in self.preference_changes.poll():
+                self.invalidate_preferences(user_id)
+        except Exception as e:
+            self.logger.error(f"Error polling preference changes: {str(e)}")
+            self.invalidate_preferences()
+
+    def get_active_warnings(self, user_id: Optional[str] = None,
+                            geometry_level: str = GEOMETRY_FULL) -> List[Dict]:
+        """Get active warnings, optionally filtered by user preferences"""
+        try:
+            self.ensure_snapshot()
+            _, warnings = self.snapshot.get_active(self.get_user_preferences_key(user_id))
+            self.logger.debug("Found %d active warnings", len(warnings))
+            return [with_geometry_level(warning, geometry_level) for warning in warnings]
         except Exception as e:
             self.logger.error(f"Error fetching active warnings: {str(e)}")
             return []
 
-    def get_historical_warnings(self, days: int = 7, user_id: Optional[str] = None) -> List[Dict]:
-        """Get historical warnings for the specified number of days"""
+    def get_warnings_at_location(self, lat: float, lon: float, user_id: Optional[str] = None,
+                                 geometry_level: str = GEOMETRY_FULL) -> List[Dict]:
+        """Get active warnings whose area contains the given point"""
+        self.ensure_snapshot()
+        _, warnings = self.snapshot.get_at_point(lon, lat, self.get_user_preferences_key(user_id))
+        return [with_geometry_level(warning, geometry_level) for warning in warnings]
+
+    def get_warnings_in_bbox(self, bbox: Tuple[float, float, float, float], user_id: Optional[str] = None,
+                             geometry_level: str = GEOMETRY_FULL) -> List[Dict]:
+        """Get active warnings whose area intersects a (min_lon, min_lat, max_lon, max_lat) box"""
+        self.ensure_snapshot()
+        _, warnings = self.snapshot.get_in_bbox(bbox, self.get_user_preferences_key(user_id))
+        return [with_geometry_level(warning, geometry_level) for warning in warnings]
+
+    def get_warnings_for_municipality(self, code: str, user_id: Optional[str] = None,
+                                      geometry_level: str = GEOMETRY_FULL) -> List[Dict]:
+        """Get active warnings for a municipality (Gemeinde) code"""
+        self.ensure_snapshot()
+        _, warnings = self.snapshot.get_for_municipality(code, self.get_user_preferences_key(user_id))
+        return [with_geometry_level(warning, geometry_level) for warning in warnings]
+
+    def get_warning_payload(self, warning_id, content_hash: Optional[str] = None) -> Optional[Dict]:
+        """Get the raw ZAMG feature of a warning, by default for its current content"""
         try:
-            start_date = datetime.utcnow() - timedelta(days=days)
-            query = {'created_at': {'$gte': start_date}}
+            if content_hash is None:
+                current = self.db.current_warnings.find_one(
+                    {'warning_id': warning_id},
+                    {'_id': 0, 'content_hash': 1}
+                ) or self.db.warning_history.find_one(
+                    {'warning_id': warning_id},
+                    {'_id': 0, 'content_hash': 1}
+                )
+                if not current:
+                    return None
+                content_hash = current.get('content_hash')
             
-            # Apply user preferences if user_id is provided
-            if user_id:
-                user_prefs = self.db.user_preferences.find_one({'user_id': user_id})
-                if user_prefs and 'warning_types' in user_prefs:
-                    query['warning_type'] = {'$in': user_prefs['warning_types']}
+            payload = self.db.warning_payloads.find_one({'warning_id': warning_id, 'content_hash': content_hash})
+            return decompress_payload(payload) if payload else None
+        except Exception as e:
+            self.logger.error(f"Error fetching payload for warning {warning_id}: {str(e)}")
+            return None
+
+    def get_active_warnings_json(self, user_id: Optional[str], serializer: Callable[[List[Dict]], str],
+                                 geometry_level: str = GEOMETRY_FULL,
+                                 encoding: str = ENCODING_IDENTITY) -> Tuple[int, bytes, str]:
+        """Get the ingest version, pre-serialized active warnings for a user and their encoding"""
+        self.ensure_snapshot()
+        return self.snapshot.get_serialized(
+            self.get_user_preferences_key(user_id), serializer, geometry_level, encoding
+        )
+
+    def get_warnings_delta(self, since: int, user_id: Optional[str] = None,
+                           geometry_level: str = GEOMETRY_FULL) -> Dict:
+        """Get the active warnings changed since an ingest version, or a full resync if it is too old"""
+        self.ensure_snapshot()
+        preferences = self.get_user_preferences_key(user_id)
+        
+        since_time = None
+        changed_ids = set()
+        removed_ids = set()
+        if since == self.snapshot.ingest_version and self.snapshot.committed_at:
+            since_time = self.snapshot.committed_at
+        elif 0 < since < self.snapshot.ingest_version:
+            entries = list(self.db.warning_changelog.find(
+                {'version': {'$gte': since, '$lte': self.snapshot.ingest_version}},
+                {'_id': 0}
+            ).sort('version', 1))
+            # Every version from since onwards must still be in the changelog
+            if [entry['version'] for entry in entries] == list(range(since, self.snapshot.ingest_version + 1)):
+                since_time = entries[0]['committed_at']
+                for entry in entries[1:]:
+                    changed_ids.update(entry['added'])
+                    changed_ids.update(entry['updated'])
+                    removed_ids.update(entry['removed'])
+        
+        if since_time is None:
+            ingest_version = self.snapshot.ingest_version
+            _, warnings = self.snapshot.get_active(preferences)
+            return {
+                'version': ingest_version,
+                'full': True,
+                'warnings': [with_geometry_level(warning, geometry_level) for warning in warnings]
+            }
+        
+        ingest_version, upserted, removed = self.snapshot.get_delta(since_time, changed_ids, removed_ids, preferences)
+        return {
+            'version': ingest_version,
+            'full': False,
+            'upserted': [with_geometry_level(warning, geometry_level) for warning in upserted],
+            'removed': removed
+        }
+
+    def get_warnings_etag(self, user_id: Optional[str], *parts) -> str:
+        """Derive an ETag from the ingest version and active set, the user's preferences and request parts"""
+        self.ensure_snapshot()
+        return make_etag(
+            *self.snapshot.current_validator(),
+            self.get_user_preferences_key(user_id),
+            *parts
+        )
+
+    def _historical_query(self, days: int, user_id: Optional[str]) -> Dict:
+        """Build the query for warnings active in the history window, filtered by user preferences"""
+        query = {'updated_at': {'$gte': historical_window_start(days)}}
+        
+        # Apply user preferences if user_id is provided
+        warning_types, municipalities = self.get_user_preferences_key(user_id)
+        if warning_types is not None:
+            query['warning_type'] = {'$in': list(warning_types)}
+        if municipalities is not None:
+            query['municipalities'] = {'$in': list(municipalities)}
+        return query
+
+    def get_historical_warnings(self, days: int = 7, user_id: Optional[str] = None,
+                                limit: int = HISTORICAL_PAGE_LIMIT,
+                                cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Get one page of historical warnings, newest first, and the cursor of the next page"""
+        # Raise on a malformed cursor so the caller can report a client error
+        position = decode_cursor(cursor) if cursor else None
+        limit = max(1, min(limit, HISTORICAL_PAGE_LIMIT))
+        try:
+            query = self._historical_query(days, user_id)
+            if position:
+                created_at, last_id = position
+                query = {'$and': [query, {'$or': [
+                    {'created_at': {'$lt': created_at}},
+                    {'created_at': created_at, '_id': {'$lt': last_id}}
+                ]}]}
             
-            warnings = list(self.db.historical_warnings.find(
+            warnings = list(self.db.warning_history.find(
                 query,
-                {'_id': 0, 'raw_data': 0}
-            ).sort('created_at', -1))
+                {'revisions': 0}
+            ).sort([('created_at', -1), ('_id', -1)]).limit(limit + 1))
+            
+            next_cursor = None
+            if len(warnings) > limit:
+                warnings = warnings[:limit]
+                next_cursor = encode_cursor(warnings[-1]['created_at'], warnings[-1]['_id'])
+            for warning in warnings:
+                del warning['_id']
             
-            self.logger.info(f"Retrieved {len(warnings)} historical warnings")
-            return warnings
+            self.logger.debug("Retrieved %d historical warnings", len(warnings))
+            return warnings, next_cursor
         except Exception as e:
             self.logger.error(f"Error fetching historical warnings: {str(e)}")
-            return []
+            return [], None
+
+    def iter_historical_warnings(self, days: int = 7, user_id: Optional[str] = None) -> Iterator[Dict]:
+        """Yield historical warnings, newest first, straight from the database cursor"""
+        warnings = self.db.warning_history.find(
+            self._historical_query(days, user_id),
+            {'_id': 0, 'revisions': 0},
+            batch_size=HISTORICAL_STREAM_BATCH_SIZE
+        ).sort([('created_at', -1), ('_id', -1)])
+        try:
+            for warning in warnings:
+                yield warning
+        finally:
+            warnings.close()
 
     def update_user_preferences(self, user_id: str, preferences: Dict) -> bool:
-        """Update user preferences for warning types"""
+        """Update user preferences for warning types and municipalities"""
         try:
+            update = {'updated_at': datetime.utcnow()}
+            if 'warning_types' in preferences or 'municipalities' not in preferences:
+                update['warning_types'] = preferences.get('warning_types', [])
+            if 'municipalities' in preferences:
+                update['municipalities'] = [str(code) for code in preferences.get('municipalities') or []]
+            
             self.db.user_preferences.update_one(
                 {'user_id': user_id},
-                {'$set': {
-                    'warning_types': preferences.get('warning_types', []),
-                    'updated_at': datetime.utcnow()
-                }},
+                {'$set': update},
                 upsert=True
             )
+            self.invalidate_preferences(user_id)
+            self.preference_changes.publish(user_id)
             self.logger.info(f"Updated preferences for user {user_id}")
             return True
         except Exception as e:
@@ -0,0 +1,311 @@
+"""Benchmarks for the WeatherService ingest and read paths.
+
+Runs against a local mongod (--mongodb-uri) or, without one, an in-process
+mongomock stand-in, and compares the results to a stored baseline.
+
+    python benchmarks/bench_service.py --mongodb-uri mongodb://localhost:27017 --save-baseline
+    python benchmarks/bench_service.py --mongodb-uri mongodb://localhost:27017
+
+Exits with status 1 when an operation regressed beyond --tolerance.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'app'))
+# The service logs to LOG_DIR; keep benchmark runs out of the real log directory
+os.environ.setdefault('LOG_DIR', tempfile.mkdtemp(prefix='bench-logs-'))
+
+from pymongo import MongoClient
+from zamg_fixtures import generate_payload, mutate_payload
+from metrics import MongoCommandMetrics, request_mongo_commands, reset_request_mongo_commands
+from weather_service import WeatherService
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Collections written by save_warnings, cleared between initial-ingest runs
+INGEST_COLLECTIONS = ('current_warnings', 'warning_payloads', 'warning_history',
+                      'warning_changelog', 'warning_stats', 'counters', 'fences')
+
+# The benchmark is the only ingest writer, so a fixed fencing token is always current
+BENCH_FENCING_TOKEN = 1
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is the process's high-water mark, so each benchmark runs in a process of its own.
+    # It is in KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if platform.system() == 'Darwin' else rss / 1024
+
+
+class Benchmark:
+    """Times one operation over many calls, with an optional untimed setup before each"""
+
+    def __init__(self, name: str, func: Callable[[int], None], iterations: int,
+                 setup: Optional[Callable[[int], None]] = None, warmup: int = 1):
+        self.name = name
+        self.func = func
+        self.iterations = iterations
+        self.setup = setup
+        self.warmup = warmup
+
+    def _call(self, iteration: int) -> None:
+        if self.setup:
+            self.setup(iteration)
+        self.func(iteration)
+
+    def run(self, count_round_trips: bool) -> Dict:
+        for iteration in range(self.warmup):
+            self._call(iteration)
+
+        timings = []
+        round_trips = 0
+        for iteration in range(self.warmup, self.warmup + self.iterations):
+            if self.setup:
+                self.setup(iteration)
+            reset_request_mongo_commands()
+            started = time.perf_counter()
+            self.func(iteration)
+            timings.append(time.perf_counter() - started)
+            round_trips += request_mongo_commands()
+
+        # Allocation tracing slows calls down, so memory is measured on a separate call
+        iteration = self.warmup + self.iterations
+        if self.setup:
+            self.setup(iteration)
+        tracemalloc.start()
+        self.func(iteration)
+        _, peak_alloc = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'iterations': self.iterations,
+            'ops_per_sec': round(len(timings) / sum(timings), 2),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+            'round_trips': round(round_trips / len(timings), 2) if count_round_trips else None,
+            'peak_alloc_kb': round(peak_alloc / 1024, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1)
+        }
+
+
+def connect(mongodb_uri: Optional[str]):
+    """Return (client, db, backend); a real mongod gets a throwaway database"""
+    if mongodb_uri:
+        client = MongoClient(mongodb_uri, event_listeners=[MongoCommandMetrics()])
+        client.admin.command('ping')
+        return client, client[f"bench_{os.getpid()}"], 'mongod'
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("Pass --mongodb-uri or install mongomock (pip install -r benchmarks/requirements.txt)")
+    client = mongomock.MongoClient()
+    return client, client.bench, 'mongomock'
+
+
+def build_benchmarks(service: WeatherService, db, args) -> Tuple[Callable[[], None], List[Benchmark]]:
+    """Return a function restoring the seeded state, and the benchmarks to run from it"""
+    payload = generate_payload(args.seed, features=args.features)
+    features = payload['features']
+
+    # Successive fetches for steady-state ingest, generated before timing starts
+    fetches = [payload]
+    for index in range(args.save_iterations + 2):
+        fetches.append(mutate_payload(fetches[-1], args.seed + index + 1))
+
+    def reset_ingest_state(iteration: int) -> None:
+        for name in INGEST_COLLECTIONS:
+            db[name].delete_many({})
+        service.refresh_snapshot()
+
+    def seed_state() -> None:
+        reset_ingest_state(0)
+        service.save_warnings(payload, BENCH_FENCING_TOKEN)
+
+    def save_next(iteration: int) -> None:
+        service.save_warnings(fetches[iteration % len(fetches)], BENCH_FENCING_TOKEN)
+
+    # A user filtering on a few warning types and the municipalities of the first warnings
+    watched = sorted({code for item in features[:10] for code in item['properties']['gemeinden']})
+    service.update_user_preferences('bench-user', {'warning_types': ['storm', 'rain', 'thunderstorm'],
+                                                   'municipalities': watched})
+
+    # A month of statistics starting on the day the payload's first warning starts
+    first_start = datetime.fromtimestamp(min(int(item['properties']['start']) for item in features))
+    stats_from = datetime(first_start.year, first_start.month, first_start.day)
+    stats_to = stats_from + timedelta(days=30)
+
+    benchmarks = [
+        Benchmark('process_warning', lambda i: service.process_warning(features[i % len(features)]),
+                  args.iterations),
+        Benchmark('save_warnings_initial', lambda i: service.save_warnings(payload, BENCH_FENCING_TOKEN),
+                  args.save_iterations, setup=reset_ingest_state),
+        Benchmark('save_warnings_incremental', save_next, args.save_iterations),
+        Benchmark('get_active_warnings', lambda i: service.get_active_warnings(), args.iterations),
+        Benchmark('get_active_warnings_filtered', lambda i: service.get_active_warnings('bench-user'),
+                  args.iterations),
+        Benchmark('get_active_warnings_low_geometry',
+                  lambda i: service.get_active_warnings(geometry_level='low'), args.iterations),
+        Benchmark('get_historical_warnings', lambda i: service.get_historical_warnings(days=7),
+                  args.iterations),
+        Benchmark('get_warning_stats',
+                  lambda i: service.get_warning_stats(stats_from, stats_to, ['day', 'warning_type', 'warning_level']),
+                  args.iterations),
+    ]
+    return seed_state, benchmarks
+
+
+def run_in_process(args, index: int) -> Dict:
+    """Run the index-th selected benchmark in this process, reporting how many remain after it"""
+    client, db, backend = connect(args.mongodb_uri)
+    try:
+        service = WeatherService(db)
+        service.logger.setLevel(logging.WARNING)
+        seed_state, benchmarks = build_benchmarks(service, db, args)
+        selected = set(args.only.split(',')) if args.only else None
+        benchmarks = [benchmark for benchmark in benchmarks if not selected or benchmark.name in selected]
+        if index >= len(benchmarks):
+            return {'backend': backend, 'remaining': 0}
+
+        # Every benchmark starts from the same ingested payload
+        seed_state()
+        benchmark = benchmarks[index]
+        return {
+            'backend': backend,
+            'name': benchmark.name,
+            'result': benchmark.run(count_round_trips=backend == 'mongod'),
+            'remaining': len(benchmarks) - index - 1
+        }
+    finally:
+        if backend == 'mongod':
+            client.drop_database(db.name)
+        client.close()
+
+
+def run_isolated(args) -> Tuple[Dict, str]:
+    """Run each selected benchmark in a fresh process, so its peak RSS is its own"""
+    results = {}
+    backend = None
+    with tempfile.TemporaryDirectory(prefix='bench-results-') as result_dir:
+        index = 0
+        while True:
+            result_file = os.path.join(result_dir, f"{index}.json")
+            command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                       '--run-index', str(index), '--result-file', result_file]
+            if subprocess.run(command).returncode != 0:
+                sys.exit(f"Benchmark {index} failed")
+            with open(result_file) as f:
+                run = json.load(f)
+            backend = run['backend']
+            if 'name' in run:
+                results[run['name']] = run['result']
+            if run['remaining'] <= 0:
+                return results, backend
+            index += 1
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every metric that is worse than the baseline by more than the tolerance"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        if result['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: ops/sec {result['ops_per_sec']} < baseline {base['ops_per_sec']}")
+        for key in ('p50_ms', 'p99_ms', 'peak_alloc_kb'):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {result[key]} > baseline {base[key]}")
+        # Round trips are deterministic, so any increase is a regression
+        if result['round_trips'] is not None and base.get('round_trips') is not None \
+                and result['round_trips'] > base['round_trips']:
+            regressions.append(f"{name}: round trips {result['round_trips']} > baseline {base['round_trips']}")
+    return regressions
+
+
+def print_table(results: Dict, baseline: Optional[Dict]) -> None:
+    header = f"{'operation':36} {'ops/sec':>10} {'p50 ms':>9} {'p99 ms':>9} {'trips':>6} {'alloc KB':>9} {'rss MB':>7}"
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        trips = '-' if result['round_trips'] is None else f"{result['round_trips']:g}"
+        line = (f"{name:36} {result['ops_per_sec']:>10} {result['p50_ms']:>9} {result['p99_ms']:>9} "
+                f"{trips:>6} {result['peak_alloc_kb']:>9} {result['peak_rss_mb']:>7}")
+        base = (baseline or {}).get('results', {}).get(name)
+        if base:
+            change = (result['ops_per_sec'] - base['ops_per_sec']) / base['ops_per_sec'] * 100
+            line += f"   {change:+.1f}% ops/sec vs baseline"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongodb-uri', default=os.environ.get('BENCH_MONGODB_URI'),
+                        help="mongod to benchmark against (default: in-process mongomock)")
+    parser.add_argument('--features', type=int, default=200, help="warnings per synthetic payload")
+    parser.add_argument('--seed', type=int, default=1, help="payload generator seed")
+    parser.add_argument('--iterations', type=int, default=200, help="calls per read benchmark")
+    parser.add_argument('--save-iterations', type=int, default=10, help="calls per save benchmark")
+    parser.add_argument('--only', help="comma-separated operations to run")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline file to compare to")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed fractional slowdown")
+    # Used by run_isolated to run one benchmark per process
+    parser.add_argument('--run-index', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.result_file:
+        run = run_in_process(args, args.run_index)
+        with open(args.result_file, 'w') as f:
+            json.dump(run, f)
+        return
+
+    results, backend = run_isolated(args)
+
+    params = {'backend': backend, 'features': args.features, 'seed': args.seed,
+              'python': platform.python_version()}
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print(f"Note: baseline was recorded with {baseline.get('params')}, this run uses {params}")
+
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
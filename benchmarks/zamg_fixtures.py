@@ -0,0 +1,98 @@
+"""Seeded generator of synthetic ZAMG getWarnstatus GeoJSON payloads."""
+import copy
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+# Rough bounding box of Austria (lon_min, lat_min, lon_max, lat_max)
+AUSTRIA_BBOX = (9.5, 46.4, 17.2, 49.0)
+
+# Federal state prefixes of Austrian municipality codes (Gemeindekennziffer)
+STATE_PREFIXES = range(1, 10)
+
+
+def municipality_codes(rng: random.Random, count: int) -> List[str]:
+    """Random five-digit municipality codes clustered in one federal state"""
+    state = rng.choice(STATE_PREFIXES)
+    district = rng.randint(1, 20)
+    return sorted({f"{state}{district:02d}{rng.randint(1, 99):02d}" for _ in range(count)})
+
+
+def polygon(rng: random.Random, vertices: int, radius: float = 0.3) -> Dict:
+    """A star-shaped polygon with the given vertex count somewhere in Austria"""
+    lon_min, lat_min, lon_max, lat_max = AUSTRIA_BBOX
+    center_lon = rng.uniform(lon_min + radius, lon_max - radius)
+    center_lat = rng.uniform(lat_min + radius, lat_max - radius)
+    ring = []
+    for index in range(vertices):
+        angle = 2 * math.pi * index / vertices
+        distance = radius * rng.uniform(0.6, 1.0)
+        ring.append([
+            round(center_lon + distance * math.cos(angle), 6),
+            round(center_lat + distance * math.sin(angle) * 0.7, 6)
+        ])
+    ring.append(list(ring[0]))
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+def feature(rng: random.Random, warning_id: int, vertices: int, municipalities: int,
+            now: Optional[int] = None) -> Dict:
+    """One warning feature shaped like the ZAMG API's"""
+    now = now or int(time.time())
+    start = now - rng.randint(0, 12) * 3600
+    return {
+        'type': 'Feature',
+        'geometry': polygon(rng, vertices),
+        'properties': {
+            'warnid': warning_id,
+            'chgid': rng.randint(1, 10 ** 6),
+            'verlaufid': rng.randint(1, 10 ** 6),
+            'wtype': rng.randint(1, 7),
+            'wlevel': rng.choices((1, 2, 3), weights=(6, 3, 1))[0],
+            'start': str(start),
+            'end': str(start + rng.randint(6, 72) * 3600),
+            'create': str(start - 3600),
+            'gemeinden': municipality_codes(rng, municipalities)
+        }
+    }
+
+
+def generate_payload(seed: int, features: int = 200, min_vertices: int = 8, max_vertices: int = 400,
+                     min_municipalities: int = 1, max_municipalities: int = 60,
+                     now: Optional[int] = None) -> Dict:
+    """A full getWarnstatus response; the same arguments always give the same payload"""
+    rng = random.Random(seed)
+    now = now or int(time.time())
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            feature(
+                rng,
+                100000 + index,
+                rng.randint(min_vertices, max_vertices),
+                rng.randint(min_municipalities, max_municipalities),
+                now
+            )
+            for index in range(features)
+        ]
+    }
+
+
+def mutate_payload(payload: Dict, seed: int, changed: float = 0.1, removed: float = 0.02,
+                   added: float = 0.02) -> Dict:
+    """The next fetch: some warnings escalate or extend, a few expire and a few are new"""
+    rng = random.Random(seed)
+    features = copy.deepcopy(payload['features'])
+    rng.shuffle(features)
+    drop = int(len(features) * removed)
+    features = features[drop:]
+    for item in features[:int(len(features) * changed)]:
+        properties = item['properties']
+        properties['wlevel'] = min(3, properties['wlevel'] + 1)
+        properties['end'] = str(int(properties['end']) + 3600)
+        properties['chgid'] += 1
+    next_id = max((item['properties']['warnid'] for item in features), default=100000) + 1
+    for offset in range(int(len(payload['features']) * added)):
+        features.append(feature(rng, next_id + offset, rng.randint(8, 400), rng.randint(1, 60)))
+    return {'type': 'FeatureCollection', 'features': features}
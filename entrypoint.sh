@@ -7,5 +7,6 @@ mkdir -p /app/logs
 chown -R appuser:appuser /app/logs
 chmod -R 755 /app/logs
 
-# Start gunicorn
-exec gunicorn --bind 0.0.0.0:5000 --worker-class gevent --workers 1 "app:create_app()"
+# Start gunicorn; background jobs are elected per job through Mongo leases,
+# so more than one worker no longer multiplies ZAMG calls or token refreshes
+exec gunicorn --bind 0.0.0.0:5000 --worker-class gevent --workers ${GUNICORN_WORKERS:-1} "app:create_app()"
@@ -0,0 +1,295 @@
+"""End-to-end HTTP load test of the app under gunicorn, with local Google and ZAMG stand-ins.
+
+For each worker class and worker count this starts gunicorn against the given
+mongod, logs in --users sessions through /login/callback, then has every
+session poll the dashboard endpoints for --duration seconds and reports
+throughput and tail latency.
+
+    python loadtest/run_load.py --mongodb-uri mongodb://localhost:27017 \\
+        --worker-classes gevent,gthread --workers 1,2,4 --users 200 --duration 30
+
+Use a throwaway mongod: the app always uses its "myapp" database. Load-test
+users (google_id "load-*") are removed afterwards unless --keep-users is given.
+Pass --target-url to drive an app that is already running instead.
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from stand_ins import start_stand_ins, stand_in_env
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT_DIR, 'app')
+
+SESSION_COOKIE_NAME = 'infocal_session'
+
+# Dashboard-style request mix: mostly revalidating polls, some deltas and point lookups
+REQUEST_MIX = (
+    ('poll', 0.7),
+    ('delta', 0.2),
+    ('at', 0.1)
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def start_app(worker_class: str, workers: int, env: Dict) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen(
+        ['gunicorn', '--bind', f"127.0.0.1:{port}", '--worker-class', worker_class,
+         '--workers', str(workers), '--threads', '8' if worker_class == 'gthread' else '1',
+         '--worker-connections', '1000', 'app:create_app()'],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def stop_app(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def wait_until_ready(base_url: str, timeout: float) -> None:
+    """Wait until the app answers /healthz and has ingested a warnings version"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            health = requests.get(f"{base_url}/healthz", timeout=2).json()
+            if health.get('warnings_version'):
+                return
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{base_url} did not become ready within {timeout}s")
+
+
+def new_http_session() -> requests.Session:
+    http = requests.Session()
+    http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    return http
+
+
+def login(base_url: str, user: int) -> Optional[requests.Session]:
+    """Log in through the OAuth callback; the stand-in accepts code user-<n>"""
+    http = new_http_session()
+    response = http.get(f"{base_url}/login/callback", params={'code': f"user-{user}"},
+                        allow_redirects=False, timeout=30)
+    cookie = response.cookies.get(SESSION_COOKIE_NAME)
+    if response.status_code != 302 or not cookie:
+        return None
+    # The session cookie is marked Secure, which requests will not send over plain HTTP
+    http.headers['Cookie'] = f"{SESSION_COOKIE_NAME}={cookie}"
+    return http
+
+
+def create_sessions(base_url: str, users: int, concurrency: int) -> List[requests.Session]:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        sessions = [http for http in pool.map(lambda user: login(base_url, user), range(users)) if http]
+    elapsed = time.perf_counter() - started
+    print(f"  logged in {len(sessions)}/{users} sessions in {elapsed:.1f}s ({len(sessions) / elapsed:.0f}/s)")
+    return sessions
+
+
+class VirtualUser:
+    """One dashboard polling the warning endpoints with conditional and delta requests"""
+
+    def __init__(self, http: requests.Session, base_url: str, interval: float, rng: random.Random):
+        self.http = http
+        self.base_url = base_url
+        self.interval = interval
+        self.rng = rng
+        self.etag = None
+        self.version = None
+
+    def request(self) -> Tuple[str, int]:
+        kind = self.rng.choices([name for name, _ in REQUEST_MIX], [weight for _, weight in REQUEST_MIX])[0]
+        headers = {'Accept-Encoding': 'gzip, br'}
+        if kind == 'delta' and self.version is not None:
+            response = self.http.get(f"{self.base_url}/api/warnings", params={'since': self.version},
+                                     headers=headers, timeout=30)
+        elif kind == 'at':
+            response = self.http.get(f"{self.base_url}/api/warnings/at",
+                                     params={'lat': self.rng.uniform(46.5, 48.9), 'lon': self.rng.uniform(9.6, 17.1)},
+                                     headers=headers, timeout=30)
+        else:
+            kind = 'poll'
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            response = self.http.get(f"{self.base_url}/api/warnings", headers=headers, timeout=30)
+            if response.status_code == 200:
+                self.etag = response.headers.get('ETag')
+        if response.status_code == 200 and 'X-Warnings-Version' in response.headers:
+            self.version = response.headers['X-Warnings-Version']
+        return kind, response.status_code
+
+    def run(self, stop_at: float, results: Dict) -> None:
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                kind, status = self.request()
+            except requests.RequestException:
+                kind, status = 'error', 0
+            elapsed = time.perf_counter() - started
+            results['latencies'].setdefault(kind, []).append(elapsed)
+            results['statuses'][status] = results['statuses'].get(status, 0) + 1
+            if self.interval:
+                time.sleep(max(0.0, self.interval * self.rng.uniform(0.5, 1.5) - elapsed))
+
+
+def drive_load(base_url: str, sessions: List[requests.Session], duration: float, interval: float,
+               seed: int) -> Dict:
+    stop_at = time.monotonic() + duration
+    per_thread = []
+    threads = []
+    for index, http in enumerate(sessions):
+        results = {'latencies': {}, 'statuses': {}}
+        per_thread.append(results)
+        user = VirtualUser(http, base_url, interval, random.Random(seed + index))
+        threads.append(threading.Thread(target=user.run, args=(stop_at, results), daemon=True))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Merge per-thread results, which were recorded without locking
+    latencies, statuses = {}, {}
+    for results in per_thread:
+        for kind, samples in results['latencies'].items():
+            latencies.setdefault(kind, []).extend(samples)
+        for status, count in results['statuses'].items():
+            statuses[status] = statuses.get(status, 0) + count
+    everything = [sample for samples in latencies.values() for sample in samples]
+    return {
+        'requests': len(everything),
+        'throughput': round(len(everything) / elapsed, 1),
+        'p50_ms': round(percentile(everything, 0.5) * 1000, 1),
+        'p95_ms': round(percentile(everything, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(everything, 0.99) * 1000, 1),
+        'max_ms': round(max(everything, default=0) * 1000, 1),
+        'by_kind': {kind: {'requests': len(samples), 'p99_ms': round(percentile(samples, 0.99) * 1000, 1)}
+                    for kind, samples in sorted(latencies.items())},
+        'statuses': {str(status): count for status, count in sorted(statuses.items())}
+    }
+
+
+def run_scenario(label: str, base_url: str, args) -> Dict:
+    print(f"{label}: {base_url}")
+    sessions = create_sessions(base_url, args.users, args.login_concurrency)
+    if not sessions:
+        raise RuntimeError("No session could log in; check the app log")
+    result = drive_load(base_url, sessions, args.duration, args.interval, args.seed)
+    print(f"  {result['requests']} requests, {result['throughput']} req/s, "
+          f"p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms p99 {result['p99_ms']}ms, "
+          f"statuses {result['statuses']}")
+    return dict(result, scenario=label, sessions=len(sessions))
+
+
+def remove_load_users(mongodb_uri: str) -> None:
+    from pymongo import MongoClient
+    client = MongoClient(mongodb_uri)
+    try:
+        removed = client.myapp.users.delete_many({'google_id': {'$regex': '^load-'}}).deleted_count
+        print(f"Removed {removed} load-test users")
+    finally:
+        client.close()
+
+
+def print_summary(results: List[Dict]) -> None:
+    header = f"{'scenario':24} {'sessions':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    print('\n' + header)
+    print('-' * len(header))
+    for result in results:
+        print(f"{result['scenario']:24} {result['sessions']:>8} {result['throughput']:>9} {result['p50_ms']:>8} "
+              f"{result['p95_ms']:>8} {result['p99_ms']:>8} {result['max_ms']:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongodb-uri', default=os.environ.get('LOADTEST_MONGODB_URI'),
+                        help="mongod the app under test uses (required unless --target-url)")
+    parser.add_argument('--target-url', help="drive an already running app instead of starting gunicorn")
+    parser.add_argument('--worker-classes', default='gevent', help="comma-separated gunicorn worker classes")
+    parser.add_argument('--workers', default='1', help="comma-separated worker counts")
+    parser.add_argument('--users', type=int, default=100, help="concurrent authenticated sessions")
+    parser.add_argument('--login-concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of polling per scenario")
+    parser.add_argument('--interval', type=float, default=1.0, help="mean seconds between a user's requests")
+    parser.add_argument('--features', type=int, default=200, help="warnings in the ZAMG stand-in payload")
+    parser.add_argument('--rotate', type=float, default=60.0, help="seconds between ZAMG payload changes")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ready-timeout', type=float, default=120.0)
+    parser.add_argument('--keep-users', action='store_true')
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    if args.target_url:
+        results.append(run_scenario('target', args.target_url.rstrip('/'), args))
+    else:
+        if not args.mongodb_uri:
+            sys.exit("--mongodb-uri is required to start the app")
+        stand_ins = start_stand_ins(seed=args.seed, features=args.features, rotate=args.rotate)
+        env = dict(
+            os.environ,
+            MONGODB_URI=args.mongodb_uri,
+            SECRET_KEY='load-test-secret',
+            GOOGLE_CLIENT_ID='load-test',
+            GOOGLE_CLIENT_SECRET='load-test',
+            LOG_DIR=tempfile.mkdtemp(prefix='loadtest-logs-'),
+            INGEST_MODE='embedded',
+            INGEST_INTERVAL='10',
+            **stand_in_env(stand_ins)
+        )
+        print(f"Stand-ins at {stand_ins.base_url}, app logs in {env['LOG_DIR']}")
+        try:
+            for worker_class in args.worker_classes.split(','):
+                for workers in (int(count) for count in args.workers.split(',')):
+                    process, base_url = start_app(worker_class, workers, env)
+                    try:
+                        wait_until_ready(base_url, args.ready_timeout)
+                        results.append(run_scenario(f"{worker_class} x{workers}", base_url, args))
+                    finally:
+                        stop_app(process)
+        finally:
+            stand_ins.shutdown()
+            if not args.keep_users:
+                remove_load_users(args.mongodb_uri)
+
+    print_summary(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Local stand-ins for the Google OAuth endpoints and the ZAMG getWarnstatus API.
+
+The OAuth stand-in accepts any authorization code: code "user-17" logs in as
+Google subject "load-17". The ZAMG stand-in serves a seeded synthetic payload
+that changes every --rotate seconds and honours If-None-Match.
+
+    python loadtest/stand_ins.py --port 8900
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from zamg_fixtures import generate_payload, mutate_payload
+
+DISCOVERY_PATH = '/.well-known/openid-configuration'
+ZAMG_PATH = '/wsapp/api/getWarnstatus'
+
+
+class ZamgFeed:
+    """Serves successive versions of a synthetic warnings payload"""
+
+    def __init__(self, seed: int, features: int, rotate: float):
+        self.seed = seed
+        self.rotate = rotate
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self._set_payload(generate_payload(seed, features=features))
+
+    def _set_payload(self, payload) -> None:
+        self.payload = payload
+        self.body = json.dumps(payload).encode('utf-8')
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+    def current(self):
+        with self.lock:
+            if self.rotate > 0:
+                generation = int((time.monotonic() - self.started) // self.rotate)
+                while self.generation < generation:
+                    self.generation += 1
+                    self._set_payload(mutate_payload(self.payload, self.seed + self.generation))
+            return self.body, self.etag
+
+
+def make_handler(base_url: str, feed: ZamgFeed):
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status: int, body: bytes = b'', content_type: str = 'application/json', headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if status != 304:
+                self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, data, status: int = 200):
+            self._send(status, json.dumps(data).encode('utf-8'))
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == DISCOVERY_PATH:
+                self._json({
+                    'issuer': base_url,
+                    'authorization_endpoint': f"{base_url}/auth",
+                    'token_endpoint': f"{base_url}/token",
+                    'userinfo_endpoint': f"{base_url}/userinfo"
+                })
+            elif path == '/userinfo':
+                token = self.headers.get('Authorization', '').replace('Bearer ', '')
+                if not token.startswith('access-'):
+                    self._json({'error': 'invalid_token'}, 401)
+                    return
+                user = token[len('access-'):]
+                self._json({
+                    'sub': f"load-{user}",
+                    'email': f"{user}@load.test",
+                    'email_verified': True,
+                    'given_name': user
+                })
+            elif path == ZAMG_PATH:
+                body, etag = feed.current()
+                if self.headers.get('If-None-Match') == etag:
+                    self._send(304, headers={'ETag': etag})
+                else:
+                    self._send(200, body, headers={'ETag': etag})
+            else:
+                self._json({'error': 'not_found'}, 404)
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/token':
+                self._json({'error': 'not_found'}, 404)
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            form = parse_qs(self.rfile.read(length).decode('utf-8'))
+            grant_type = form.get('grant_type', [''])[0]
+            if grant_type == 'authorization_code':
+                # "user-17" -> user "17"
+                user = form.get('code', [''])[0].split('user-', 1)[-1]
+            elif grant_type == 'refresh_token':
+                user = form.get('refresh_token', [''])[0].split('refresh-', 1)[-1]
+            else:
+                self._json({'error': 'unsupported_grant_type'}, 400)
+                return
+            tokens = {
+                'access_token': f"access-{user}",
+                'token_type': 'Bearer',
+                'expires_in': 3599,
+                'scope': 'openid email profile'
+            }
+            if grant_type == 'authorization_code':
+                tokens['refresh_token'] = f"refresh-{user}"
+            self._json(tokens)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInHandler
+
+
+def start_stand_ins(port: int = 0, seed: int = 1, features: int = 200, rotate: float = 60.0,
+                    host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Start the stand-ins on a background thread; server.base_url holds their address"""
+    server = ThreadingHTTPServer((host, port), None)
+    server.daemon_threads = True
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    server.RequestHandlerClass = make_handler(server.base_url, ZamgFeed(seed, features, rotate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stand_in_env(server: ThreadingHTTPServer) -> dict:
+    """Environment pointing the app at the stand-ins"""
+    return {
+        'GOOGLE_DISCOVERY_URL': f"{server.base_url}{DISCOVERY_PATH}",
+        'GOOGLE_TOKEN_URL': f"{server.base_url}/token",
+        'ZAMG_API_URL': f"{server.base_url}{ZAMG_PATH}"
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--features', type=int, default=200)
+    parser.add_argument('--rotate', type=float, default=60.0, help="seconds between payload changes (0: never)")
+    args = parser.parse_args()
+
+    server = start_stand_ins(args.port, args.seed, args.features, args.rotate, args.host)
+    for name, value in stand_in_env(server).items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()